@@ -0,0 +1,279 @@
+''' Benchmark suite for the hot paths of the classification project in
+    TTT4275 - EDC
+
+    Times iris training (single and stacked models) and confusion matrix
+    calculation, vowel GMM training and testing, single Gaussian testing and
+    both data loaders on synthetic datasets from 150 to 10^6 samples and 4 to
+    64 features. Every benchmark records best wall time, peak traced memory
+    and throughput, and is appended as a JSON line to a history file together
+    with the git commit. A benchmark is reported as a regression when it is
+    slower than the best earlier run of the same benchmark by more than the
+    threshold. Benchmarks run with the precision from PRECISION and are only
+    compared with earlier runs in the same precision.
+    Runs headless, no figures are made.
+
+    --precision-check trains and tests both classifiers on the real datasets
+    in float64 and float32 and fails if an error rate differs by more than
+    the tolerance (percentage points).
+
+    Usage: python benchmark.py [--full] [--filter NAME] [--history FILE] [--threshold 0.2]
+           python benchmark.py --precision-check [--tolerance 1.0]
+'''
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import datacache
+import figures
+import precision
+
+figures.configure('off')
+
+import iris
+import vowels
+
+__location__ = os.path.realpath(
+    os.path.join(os.getcwd(), os.path.dirname(__file__)))
+
+## (samples, features) of synthetic datasets
+quickSizes = [(150, 4), (10000, 16), (100000, 16)]
+fullSizes = [(150, 4), (10000, 16), (100000, 32), (1000000, 4), (1000000, 64)]
+
+trainingIterations = 20
+stackedModels = 16
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of training, scoring and loading")
+    parser.add_argument('--full', action='store_true', help="include 10^6 sample datasets")
+    parser.add_argument('--filter', default='', help="only benchmarks containing this name")
+    parser.add_argument('--history', default=os.path.join(__location__, 'benchmark_history.jsonl'))
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="relative slowdown reported as regression")
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--precision-check', action='store_true',
+                        help="compare float32 and float64 error rates instead")
+    parser.add_argument('--tolerance', type=float, default=1.0,
+                        help="allowed error rate difference in percentage points")
+    args = parser.parse_args()
+
+    if args.precision_check:
+        precisionCheck(args.tolerance)
+        return
+
+    history = loadHistory(args.history)
+    commit = gitCommit()
+    nRegressions = 0
+
+    with open(args.history, 'a') as historyFile:
+        for name, nSamples, function in benchmarks(fullSizes if args.full else quickSizes):
+            if args.filter not in name:
+                continue
+            result = runBenchmark(name, nSamples, function, args.repeats)
+            result.update(commit=commit, machine=platform.node(), timestamp=time.time(),
+                          precision=precision.dtype.name)
+            historyFile.write(json.dumps(result) + '\n')
+            historyFile.flush()
+
+            earlier = [entry['time'] for entry in history if entry['name'] == name and
+                       entry.get('precision', 'float64') == precision.dtype.name]
+            regression = bool(earlier) and result['time'] > (1+args.threshold)*min(earlier)
+            nRegressions += regression
+            print("%-45s %10.4f s %10.1f MB %14.0f samples/s%s"
+                  %(name, result['time'], result['peakMemory']/1e6, result['throughput'],
+                    '  REGRESSION (best %.4f s)' %min(earlier) if regression else ''))
+
+    if nRegressions:
+        raise SystemExit("%d benchmark(s) regressed" %nRegressions)
+
+
+def benchmarks(sizes):
+    ''' Yields (name, number of samples, function to time) for every benchmark.
+        Dataset generation is done here, outside the timed functions.
+    '''
+    for nSamples, nFeatures in sizes:
+        suffix = '[%d x %d]' %(nSamples, nFeatures)
+
+        ## Iris classifier, data in trainingData layout
+        ## Gradient is summed over samples, so the step size is scaled down
+        data = precision.asArray(syntheticIris(nSamples, nFeatures))
+        alpha = 0.04*150/nSamples
+        W, _ = iris.training(data, trainingIterations, alpha, verbose=False)
+        yield ('iris.training' + suffix, nSamples*trainingIterations,
+               lambda data=data, alpha=alpha: iris.training(data, trainingIterations, alpha, verbose=False))
+        yield ('iris.trainingStacked[%d models]' %stackedModels + suffix,
+               stackedModels*nSamples*trainingIterations,
+               lambda data=data, alpha=alpha: iris.trainingStacked(
+                   [data]*stackedModels, trainingIterations, alpha))
+        yield ('iris.confusionMatrixCalc' + suffix, nSamples,
+               lambda data=data, W=W: quiet(iris.confusionMatrixCalc, W, data))
+
+        ## Vowel classifiers
+        dataset = syntheticVowels(nSamples, nFeatures)
+        gmms = vowels.GMMTraining(sliceDataset(dataset, 2000), 2)
+        singleModels = vowels.singleGMTraining(sliceDataset(dataset, 2000))
+        yield ('vowels.GMMTraining' + suffix, nSamples,
+               lambda dataset=dataset: vowels.GMMTraining(dataset, 2))
+        yield ('vowels.GMMTesting' + suffix, nSamples,
+               lambda dataset=dataset, gmms=gmms: vowels.GMMTesting(gmms, dataset, 2))
+        yield ('vowels.singleGMTesting' + suffix, nSamples,
+               lambda dataset=dataset, models=singleModels: vowels.singleGMTesting(models, dataset))
+
+    ## Loaders, parsing text and reading the cached arrays
+    for nSamples in sorted(set(nSamples for nSamples, _ in sizes)):
+        suffix = '[%d]' %nSamples
+        irisLoc = syntheticIrisFile(nSamples)
+        vowelLoc = syntheticVowelFile(nSamples)
+        yield ('iris.parseData' + suffix, nSamples, lambda loc=irisLoc: iris.parseData(loc))
+        yield ('vowels.parseData' + suffix, nSamples, lambda loc=vowelLoc: vowels.parseData(loc))
+        datacache.cachedArrays(vowelLoc, vowels.parseData)
+        yield ('cachedArrays' + suffix, nSamples,
+               lambda loc=vowelLoc: datacache.cachedArrays(loc, vowels.parseData))
+
+
+def precisionCheck(tolerance):
+    ''' Error rates of the iris and vowel classifiers on the real datasets in
+        float64 and float32, fails if they differ by more than tolerance
+    '''
+    errorRates = {}
+    for name in ('float64', 'float32'):
+        precision.configure(name)
+        errorRates[name] = quiet(precisionErrorRates)
+    precision.configure(os.environ.get('PRECISION'))
+
+    nFailed = 0
+    print("%-25s %10s %10s" %("Classifier", "float64", "float32"))
+    for classifier in errorRates['float64']:
+        errorRate64 = errorRates['float64'][classifier]
+        errorRate32 = errorRates['float32'][classifier]
+        failed = abs(errorRate64-errorRate32) > tolerance
+        nFailed += failed
+        print("%-25s %9.2f%% %9.2f%%%s" %(classifier, errorRate64, errorRate32,
+                                           '  FAILED' if failed else ''))
+    if nFailed:
+        raise SystemExit("%d error rate(s) differ by more than %.2f %%" %(nFailed, tolerance))
+
+
+def precisionErrorRates():
+    ''' Testing error rates in % with the configured precision '''
+    data = iris.normalize(iris.loadData())
+    trainingData, testingData = iris.splitData(data, 30)
+    errorRates = {}
+    for optimizer in ('gd', 'lbfgs'):
+        W, _ = iris.training(trainingData, 4000, verbose=False, optimizer=optimizer)
+        errorRates['iris ' + optimizer] = 100*np.mean(
+            iris.predictClasses(W, testingData) != testingData[:, -1])
+
+    types, data = vowels.loadData(range(7, 16))
+    trainingData, testingData = vowels.splitData(
+        vowels.makeDataset(data, vowels.vowelLabels(types)), 70)
+    for diag in (False, True):
+        predictions, _ = vowels.singleGMTesting(
+            vowels.singleGMTraining(trainingData, diag), testingData)
+        errorRates['vowels single diag=%s' %diag] = 100*np.mean(predictions != testingData.labels)
+    for M in (2, 3):
+        predictions, _ = vowels.GMMTesting(vowels.GMMTraining(trainingData, M), testingData, M)
+        errorRates['vowels GMM M=%d' %M] = 100*np.mean(predictions != testingData.labels)
+    return errorRates
+
+
+def runBenchmark(name, nSamples, function, repeats):
+    ''' Best wall time of repeats, then peak traced memory in a separate run '''
+    times = []
+    for _ in range(repeats):
+        startTime = time.perf_counter()
+        function()
+        times.append(time.perf_counter()-startTime)
+
+    tracemalloc.start()
+    function()
+    _, peakMemory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    bestTime = min(times)
+    return {'name': name, 'time': bestTime, 'peakMemory': peakMemory,
+            'throughput': nSamples/bestTime}
+
+
+def quiet(function, *args):
+    ''' Calls function with its printing suppressed '''
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args)
+
+
+def syntheticIris(nSamples, nFeatures, seed=0):
+    ''' Normalized iris-like data with dummy input and class ID columns '''
+    rng = np.random.default_rng(seed)
+    classID = rng.integers(0, iris.nClasses, nSamples)
+    features = rng.random((nSamples, nFeatures)) + 0.3*classID[:, np.newaxis]
+    return np.column_stack((features/features.max(axis=0), np.ones(nSamples), classID))
+
+
+def syntheticVowels(nSamples, nFeatures, seed=0):
+    ''' Vowel dataset with formant-like values around a random mean per vowel '''
+    rng = np.random.default_rng(seed)
+    labels = rng.integers(0, len(vowels.vowels), nSamples)
+    means = rng.uniform(300, 3000, (len(vowels.vowels), nFeatures))
+    features = means[labels] + rng.normal(0, 100, (nSamples, nFeatures))
+    return vowels.makeDataset(features, labels)
+
+
+def sliceDataset(dataset, nSamples):
+    ''' First nSamples rows of a shuffled copy, as dataset '''
+    rows = np.random.default_rng(0).permutation(len(dataset.labels))[:nSamples]
+    return vowels.makeDataset(dataset.features[rows], dataset.labels[rows])
+
+
+def syntheticIrisFile(nSamples):
+    ''' Text file in iris.data format '''
+    data = syntheticIris(nSamples, iris.nFeatures)
+    names = np.array(['Iris-setosa', 'Iris-versicolor', 'Iris-virginica'])
+    fileLoc = os.path.join(tempfile.gettempdir(), 'benchmark_iris_%d.data' %nSamples)
+    with open(fileLoc, 'w') as dataFile:
+        for row, name in zip(np.round(data[:, :4]*8, 1), names[data[:, -1].astype(int)]):
+            dataFile.write('%.1f,%.1f,%.1f,%.1f,%s\n' %(tuple(row) + (name,)))
+    return fileLoc
+
+
+def syntheticVowelFile(nSamples):
+    ''' Text file in vowdata_nohead.dat format '''
+    rng = np.random.default_rng(0)
+    labels = rng.integers(0, len(vowels.vowels), nSamples)
+    data = rng.integers(0, 4000, (nSamples, 15))
+    fileLoc = os.path.join(tempfile.gettempdir(), 'benchmark_vowels_%d.dat' %nSamples)
+    with open(fileLoc, 'w') as dataFile:
+        for i, row in enumerate(data):
+            dataFile.write('m%02d%s ' %(i % 100, vowels.vowels[labels[i]]) +
+                           ' '.join('%4d' %val for val in row) + '\n')
+    return fileLoc
+
+
+def loadHistory(historyLoc):
+    ''' Earlier benchmark results '''
+    if not os.path.exists(historyLoc):
+        return []
+    with open(historyLoc) as historyFile:
+        return [json.loads(line) for line in historyFile if line.strip()]
+
+
+def gitCommit():
+    ''' Current git commit, None outside a git checkout '''
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=__location__,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+if __name__ == '__main__':
+    main()
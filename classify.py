@@ -0,0 +1,193 @@
+''' Command-line pipeline runner for the classification project in TTT4275 - EDC
+
+    Subcommands:
+        train     train iris or vowel classifier and save the model
+        evaluate  train and report error rate, precision and recall on the
+                  testing data (and confusion matrix figures with --plots)
+        predict   classify samples with a saved model
+        sweep     hyperparameter sweep, see sweep.py
+
+    Settings can be given as options or in a JSON file with --config, where
+    keys are option names with '_' for '-' (options override the file). Only
+    the modules needed by the chosen subcommand are imported, so predict
+    needs numpy alone.
+
+    Examples:
+        python classify.py train iris --features 2 3 --out iris.npz
+        python classify.py evaluate iris --optimizer lbfgs --iterations 200
+        python classify.py train vowels --M 2 --cov diag --out vowels.npz
+        python classify.py evaluate vowels --config vowels.json --plots save
+        python classify.py predict iris.npz 5.1 3.5 1.4 0.2
+        python classify.py predict vowels.npz --input samples.csv
+'''
+
+import argparse
+import json
+import sys
+
+## Defaults for both tasks, overridden by --config file and options
+defaults = {
+    'iris': {'data': None, 'n_training': 30, 'iterations': 4000, 'alpha': 0.04,
+             'tol': None, 'optimizer': 'gd', 'features': [0, 1, 2, 3]},
+    'vowels': {'data': None, 'n_training': 70, 'M': 1, 'cov': 'full',
+               'features': list(range(7, 16)), 'workers': 1},
+}
+
+
+def main(argv=None):
+    import optimizers
+
+    parser = argparse.ArgumentParser(description="Iris and vowel classifier pipelines")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    for command in ('train', 'evaluate'):
+        subparser = subparsers.add_parser(command)
+        subparser.add_argument('task', choices=['iris', 'vowels'])
+        subparser.add_argument('--config', help="JSON file with settings")
+        subparser.add_argument('--data', help="data file instead of the one in Data/")
+        subparser.add_argument('--n-training', type=int, help="training samples per class")
+        subparser.add_argument('--features', type=int, nargs='+',
+                               help="iris: feature numbers 0-3, vowels: columns 1-15")
+        subparser.add_argument('--iterations', type=int, help="iris: max iterations")
+        subparser.add_argument('--alpha', type=float, help="iris: step size")
+        subparser.add_argument('--tol', type=float, help="iris: convergence tolerance")
+        subparser.add_argument('--optimizer', choices=optimizers.methods, help="iris: optimizer")
+        subparser.add_argument('--M', type=int, help="vowels: mixture components, 1 = single Gaussian")
+        subparser.add_argument('--cov', choices=['full', 'diag', 'tied'],
+                               help="vowels: covariance type, tied for M > 1 only")
+        subparser.add_argument('--workers', type=int, help="vowels: single Gaussian training threads")
+        subparser.add_argument('--precision', choices=['float64', 'float32'],
+                               help="floating point precision of data and models")
+        subparser.add_argument('--plots', choices=['show', 'save', 'off'], default='off')
+        subparser.add_argument('--out', help="save trained model to this .npz file")
+
+    predictParser = subparsers.add_parser('predict')
+    predictParser.add_argument('model', help="model saved by train")
+    predictParser.add_argument('values', type=float, nargs='*', help="features of one sample")
+    predictParser.add_argument('--input', help="CSV file with one sample per line, - for stdin")
+
+    sweepParser = subparsers.add_parser('sweep')
+    sweepParser.add_argument('grid')
+    sweepParser.add_argument('results')
+    sweepParser.add_argument('--workers', type=int)
+    sweepParser.add_argument('--table')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'predict':
+        predict(args)
+    elif args.command == 'sweep':
+        import sweep
+        sweep.run(args.grid, args.results, args.workers, args.table)
+    else:
+        settings = loadSettings(args)
+        import figures
+        import precision
+        figures.configure(args.plots)
+        if args.precision:
+            precision.configure(args.precision)
+        if args.task == 'iris':
+            runIris(args.command, settings, args.out)
+        else:
+            runVowels(args.command, settings, args.out)
+        figures.flush()
+
+
+def loadSettings(args):
+    ''' Defaults, updated with --config file, updated with given options '''
+    settings = dict(defaults[args.task])
+    if args.config:
+        with open(args.config) as configFile:
+            settings.update(json.load(configFile))
+    for key in settings:
+        if getattr(args, key, None) is not None:
+            settings[key] = getattr(args, key)
+    return settings
+
+
+def runIris(command, settings, modelLoc):
+    ''' Trains (and evaluates) the iris classifier '''
+    import iris
+
+    rawData = iris.loadData(settings['data'] or iris.irisDataLoc)
+    ## Columns in the given order, which is also the order of saved features
+    data = iris.normalize(rawData)[:, list(settings['features']) + [-1]]
+    trainingData, testingData = iris.splitData(data, settings['n_training'])
+
+    W, nIterationsUsed = iris.training(trainingData, settings['iterations'], settings['alpha'],
+                                       tol=settings['tol'], verbose=command == 'evaluate',
+                                       optimizer=settings['optimizer'])
+    print("Trained with %s optimizer, %d iterations" %(settings['optimizer'], nIterationsUsed))
+
+    if command == 'evaluate':
+        import evaluation
+        predictions = iris.predictClasses(W, testingData)
+        report(evaluation.evaluatePredictions(predictions, testingData[:, -1].astype(int),
+                                              iris.nClasses), iris.classLabels)
+        iris.plotConfusionMatrix(iris.confusionMatrixCalc(W, testingData), len(settings['features']))
+
+    if modelLoc:
+        import models
+        scale = iris.featureScale(rawData)[settings['features']]
+        models.saveIrisModel(modelLoc, W, scale, settings['features'], iris.classLabels)
+        print("Model saved to %s" %modelLoc)
+
+
+def runVowels(command, settings, modelLoc):
+    ''' Trains (and evaluates) the vowel classifier '''
+    import vowels
+
+    types, data = vowels.loadData(settings['features'], settings['data'] or vowels.vowelDataLoc)
+    dataset = vowels.makeDataset(data, vowels.vowelLabels(types))
+    trainingData, testingData = vowels.splitData(dataset, settings['n_training'])
+
+    if settings['M'] == 1 and settings['cov'] not in ('full', 'diag'):
+        raise SystemExit("Covariance type '%s' needs --M > 1" %settings['cov'])
+
+    if settings['M'] == 1:
+        scoringModel = vowels.singleGMScoringModel(
+            vowels.singleGMTraining(trainingData, settings['cov'] == 'diag', settings['workers']))
+    else:
+        scoringModel = vowels.GMMScoringModel(
+            vowels.GMMTraining(trainingData, settings['M'], covType=settings['cov']))
+
+    if command == 'evaluate':
+        import evaluation
+        import scoring
+        predictions = scoring.predictClasses(scoringModel, testingData.features)
+        report(evaluation.evaluatePredictions(predictions, testingData.labels,
+                                              len(vowels.vowels)), vowels.vowels)
+        vowels.plotConfusionMatrix(vowels.confusionMatrixCalc(predictions, testingData.labels))
+
+    if modelLoc:
+        import models
+        models.saveVowelModel(modelLoc, scoringModel, settings['features'], vowels.vowels)
+        print("Model saved to %s" %modelLoc)
+
+
+def report(result, classLabels):
+    ''' Prints error rate and per-class precision and recall '''
+    print("Error rate = %.1f %%" %result['errorRate'])
+    print("%-12s %10s %10s" %("Class", "Precision", "Recall"))
+    for label, precision, recall in zip(classLabels, result['precision'], result['recall']):
+        print("%-12s %10.3f %10.3f" %(label, precision, recall))
+
+
+def predict(args):
+    ''' Prints predicted class label for every sample '''
+    import numpy as np
+    import models
+
+    model = models.loadModel(args.model)
+    if args.input:
+        samples = np.loadtxt(sys.stdin if args.input == '-' else args.input,
+                             delimiter=',', ndmin=2)
+    else:
+        samples = np.array([args.values])
+
+    for label in models.predictLabels(model, samples):
+        print(label)
+
+
+if __name__ == '__main__':
+    main()
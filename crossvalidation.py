@@ -0,0 +1,114 @@
+''' Cross-validation engine for the classification project in TTT4275 - EDC
+
+    Splits are given as (training indices, testing indices) pairs into the
+    full dataset, so no fold copies the data up front. The classifier is
+    given as a function
+        fitPredict(data, labels, trainIndex, testIndex) -> predicted class indices
+    which trains on the training rows and predicts the testing rows, see
+    iris.crossValidationFitPredict and vowels.crossValidationFitPredict.
+    Folds are run in a process pool where every worker receives the dataset
+    once.
+'''
+
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+_data = None
+_labels = None
+
+
+def stratifiedKFold(labels, k, seed=None):
+    ''' k folds with the classes spread evenly over the folds. Samples are
+        shuffled within each class if seed is given.
+    '''
+    labels = np.asarray(labels)
+    rng = np.random.default_rng(seed)
+    testFolds = [[] for _ in range(k)]
+
+    for label in np.unique(labels):
+        classIndex = np.flatnonzero(labels == label)
+        if seed is not None:
+            classIndex = rng.permutation(classIndex)
+        for fold, part in enumerate(np.array_split(classIndex, k)):
+            testFolds[fold].append(part)
+
+    return [splitFromTest(len(labels), np.concatenate(parts)) for parts in testFolds]
+
+
+def repeatedRandomSplits(labels, nTraining, nRepeats, seed=None):
+    ''' nRepeats random splits with nTraining training samples from each class
+        and the rest of the class for testing
+    '''
+    labels = np.asarray(labels)
+    rng = np.random.default_rng(seed)
+    splits = []
+
+    for _ in range(nRepeats):
+        trainParts = [rng.permutation(np.flatnonzero(labels == label))[:nTraining]
+                      for label in np.unique(labels)]
+        trainIndex = np.sort(np.concatenate(trainParts))
+        testMask = np.ones(len(labels), dtype=bool)
+        testMask[trainIndex] = False
+        splits.append((trainIndex, np.flatnonzero(testMask)))
+
+    return splits
+
+
+def leaveOneGroupOut(groups):
+    ''' One fold per group, testing on that group and training on the rest '''
+    groups = np.asarray(groups)
+    return [splitFromTest(len(groups), np.flatnonzero(groups == group))
+            for group in np.unique(groups)]
+
+
+def speakerGroups(types, level='speaker'):
+    ''' Groups from vowel file names like 'm01ae': the speaker ('m01') or,
+        with level='category', man/woman/boy/girl ('m', 'w', 'b', 'g')
+    '''
+    nChars = 3 if level == 'speaker' else 1
+    return np.array([name[:nChars] for name in types])
+
+
+def splitFromTest(nSamples, testIndex):
+    ''' Training indices are all indices not in testIndex '''
+    testIndex = np.sort(testIndex)
+    trainMask = np.ones(nSamples, dtype=bool)
+    trainMask[testIndex] = False
+    return np.flatnonzero(trainMask), testIndex
+
+
+def crossValidate(fitPredict, data, labels, splits, nWorkers=1):
+    ''' Runs fitPredict on every split and returns dict with error rate in
+        percent and time in seconds for every fold, and mean and standard
+        deviation of the error rates.
+    '''
+    labels = np.asarray(labels)
+
+    if nWorkers > 1:
+        with ProcessPoolExecutor(max_workers=nWorkers, initializer=setWorkerData,
+                                 initargs=(data, labels)) as executor:
+            foldResults = list(executor.map(runFold, [fitPredict]*len(splits), splits))
+    else:
+        setWorkerData(data, labels)
+        foldResults = [runFold(fitPredict, split) for split in splits]
+
+    errorRates = np.array([errorRate for errorRate, _ in foldResults])
+    return {'errorRates': errorRates, 'foldTimes': np.array([t for _, t in foldResults]),
+            'mean': errorRates.mean(), 'std': errorRates.std()}
+
+
+def setWorkerData(data, labels):
+    ''' Stores the dataset in the (worker) process '''
+    global _data, _labels
+    _data, _labels = data, labels
+
+
+def runFold(fitPredict, split):
+    ''' Trains and tests one fold, returns error rate and time used '''
+    trainIndex, testIndex = split
+    startTime = time.perf_counter()
+    predictions = fitPredict(_data, _labels, trainIndex, testIndex)
+    errorRate = np.mean(np.asarray(predictions) != _labels[testIndex])*100
+    return errorRate, time.perf_counter()-startTime
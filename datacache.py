@@ -0,0 +1,65 @@
+''' Parsed-dataset cache for the classification project in TTT4275 - EDC
+
+    Text data files are parsed once into typed numpy arrays which are stored
+    as .npy files next to the source (in a .cache directory). The cache entry
+    is keyed by the path, modification time and size of the source file, so
+    editing the source gives a new parse. Cached arrays are memory-mapped on
+    load. If the cache can not be written (e.g. read-only data directory),
+    the parsed arrays are returned without caching.
+'''
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+
+def sourceKey(sourceLoc):
+    ''' Key identifying the current version of a source file '''
+    stat = os.stat(sourceLoc)
+    keyString = '%s:%d:%d' %(os.path.realpath(sourceLoc), stat.st_mtime_ns, stat.st_size)
+    return hashlib.sha1(keyString.encode()).hexdigest()[:16]
+
+
+def cachedArrays(sourceLoc, parser, cacheDir=None):
+    ''' Returns the dict of named arrays parser(sourceLoc) gives, reading it
+        from the cache if the source file is unchanged since last parse.
+    '''
+    if cacheDir is None:
+        cacheDir = os.path.join(os.path.dirname(os.path.realpath(sourceLoc)), '.cache')
+    baseName = os.path.basename(sourceLoc)
+    entryDir = os.path.join(cacheDir, '%s-%s' %(baseName, sourceKey(sourceLoc)))
+
+    if os.path.isdir(entryDir):
+        return {name[:-4]: np.load(os.path.join(entryDir, name), mmap_mode='r')
+                for name in os.listdir(entryDir) if name.endswith('.npy')}
+
+    arrays = parser(sourceLoc)
+
+    ## Write to a temporary directory first so a half written entry is never used
+    tempDir = None
+    try:
+        os.makedirs(cacheDir, exist_ok=True)
+        tempDir = tempfile.mkdtemp(dir=cacheDir)
+        for name, array in arrays.items():
+            np.save(os.path.join(tempDir, name + '.npy'), array)
+    except OSError:
+        ## Cache not writable, the parse is still valid
+        if tempDir is not None:
+            shutil.rmtree(tempDir, ignore_errors=True)
+        return arrays
+    try:
+        os.rename(tempDir, entryDir)
+    except OSError:
+        ## Another process wrote the same entry meanwhile
+        shutil.rmtree(tempDir, ignore_errors=True)
+
+    ## Removing entries for older versions of the source
+    for name in os.listdir(cacheDir):
+        oldDir = os.path.join(cacheDir, name)
+        if name.startswith(baseName + '-') and oldDir != entryDir:
+            shutil.rmtree(oldDir, ignore_errors=True)
+
+    return arrays
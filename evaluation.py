@@ -0,0 +1,127 @@
+''' Batched evaluation of classifier predictions for the classification
+    project in TTT4275 - EDC
+
+    Confusion matrices are accumulated with np.bincount and class labels are
+    mapped to indices through a sorted lookup, so millions of predictions are
+    evaluated without Python loops. subsetSearch is the feature subset search
+    used by both classifiers.
+'''
+
+import hashlib
+import itertools
+
+import numpy as np
+
+
+def confusionMatrix(rowClasses, colClasses, nClasses):
+    ''' Counts every (row class, column class) pair into an nClasses x nClasses
+        matrix. Which of predicted/actual goes along the rows is up to caller.
+    '''
+    rowClasses = np.asarray(rowClasses, dtype=np.intp)
+    colClasses = np.asarray(colClasses, dtype=np.intp)
+    counts = np.bincount(rowClasses*nClasses + colClasses, minlength=nClasses*nClasses)
+    return counts.reshape(nClasses, nClasses)
+
+
+def labelIndices(labels, classLabels):
+    ''' Maps every label to its index in classLabels '''
+    labels = np.asarray(labels)
+    classLabels = np.asarray(classLabels)
+
+    sorter = np.argsort(classLabels)
+    sortedPositions = np.searchsorted(classLabels, labels, sorter=sorter)
+    sortedPositions = np.minimum(sortedPositions, len(classLabels)-1)
+    indices = sorter[sortedPositions]
+
+    unknown = classLabels[indices] != labels
+    if np.any(unknown):
+        raise ValueError("Unknown class label(s): %s" %np.unique(labels[unknown]))
+    return indices
+
+
+def errorRate(confMatrix):
+    ''' Error rate in percent from confusion matrix '''
+    return (1-np.trace(confMatrix)/np.sum(confMatrix))*100
+
+
+def evaluatePredictions(predicted, actual, nClasses):
+    ''' Confusion matrix (actual class along rows, predicted along columns),
+        error rate in percent and per-class precision and recall for class
+        index arrays predicted and actual.
+    '''
+    confMatrix = confusionMatrix(actual, predicted, nClasses)
+    correct = np.diagonal(confMatrix).astype(float)
+    nPredicted = confMatrix.sum(axis=0)
+    nActual = confMatrix.sum(axis=1)
+
+    ## Classes never predicted / never present get precision / recall 0
+    precision = np.divide(correct, nPredicted, out=np.zeros(nClasses), where=nPredicted > 0)
+    recall = np.divide(correct, nActual, out=np.zeros(nClasses), where=nActual > 0)
+
+    return {'confusionMatrix': confMatrix, 'errorRate': errorRate(confMatrix),
+            'precision': precision, 'recall': recall}
+
+
+def subsetSearch(features, evaluate, cache, method = 'exhaustive', maxSize = None,
+                 settings = ()):
+    ''' Searches subsets (sorted tuples) of features and returns a list of
+        (subset, testing error rate, training error rate) sorted by testing
+        error rate, for all subsets in cache with the same settings.
+
+        evaluate is called with a list of subsets not in cache and returns
+        their (testing, training) error rates, which are stored in the dict
+        cache ((settings, subset) -> error rates). settings is a tuple of
+        everything else the error rates depend on (data, training
+        parameters), so one cache can be shared by searches with different
+        settings.
+
+        method:
+            - 'exhaustive' = all subsets with up to maxSize features
+            - 'forward' = greedy, adding the best feature one at a time
+            - 'backward' = greedy, removing the least useful feature one at a time
+    '''
+    features = tuple(features)
+    maxSize = len(features) if maxSize is None else maxSize
+
+    def evaluateNew(subsets):
+        subsets = [subset for subset in subsets if (settings, subset) not in cache]
+        if subsets:
+            cache.update(zip([(settings, subset) for subset in subsets], evaluate(subsets)))
+
+    def errorRates(subset):
+        return cache[(settings, subset)]
+
+    if method == 'exhaustive':
+        evaluateNew([subset for n in range(1, maxSize+1)
+                     for subset in itertools.combinations(features, n)])
+    elif method == 'forward':
+        selected = ()
+        while len(selected) < len(features):
+            candidates = [tuple(sorted(selected + (feature,)))
+                          for feature in features if feature not in selected]
+            evaluateNew(candidates)
+            selected = min(candidates, key=errorRates)
+    elif method == 'backward':
+        selected = features
+        evaluateNew([selected])
+        while len(selected) > 1:
+            candidates = [tuple(feature for feature in selected if feature != removed)
+                          for removed in selected]
+            evaluateNew(candidates)
+            selected = min(candidates, key=errorRates)
+    else:
+        raise ValueError("Unknown search method '%s'" %method)
+
+    return sorted(((subset,) + tuple(rates) for (subsetSettings, subset), rates in cache.items()
+                   if subsetSettings == settings),
+                  key=lambda result: (result[1], result[2], len(result[0])))
+
+
+def dataKey(*arrays):
+    ''' Short fingerprint of the contents of arrays, to tell data apart in caches '''
+    digest = hashlib.sha1()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(str((array.dtype.str, array.shape)).encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()[:16]
@@ -0,0 +1,85 @@
+''' Figure output for the classification project scripts in TTT4275 - EDC
+
+    Plots are shown interactively by default. For batch jobs the figures can
+    instead be written to an output directory by a background worker using the
+    Agg backend, or skipped entirely, so the computations never wait on
+    rendering. Set through configure() or the environment variables
+        PLOT_MODE   = show | save | off
+        PLOT_DIR    = output directory for saved figures (default 'plots')
+        PLOT_FORMAT = png | svg | pdf (default 'png')
+'''
+
+import atexit
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import instrument
+
+plotMode = 'show'
+outputDir = 'plots'
+fileFormat = 'png'
+
+_renderer = None
+_pending = []
+_figureCount = 0
+
+
+def configure(mode=None, directory=None, fmt=None):
+    ''' Sets plot mode, output directory and file format for figures '''
+    global plotMode, outputDir, fileFormat
+
+    if mode is not None:
+        if mode not in ('show', 'save', 'off'):
+            raise ValueError("Unknown plot mode '%s'" %mode)
+        plotMode = mode
+    if directory is not None:
+        outputDir = directory
+    if fmt is not None:
+        fileFormat = fmt
+
+    ## Non-interactive backend when nothing is shown on screen
+    if plotMode == 'save':
+        import matplotlib
+        matplotlib.use('Agg')
+
+
+def enabled():
+    ''' True if figures should be made at all '''
+    return plotMode != 'off'
+
+
+@instrument.timed('render')
+def output(fig, name):
+    ''' Shows the figure, or hands it to the background worker which saves it
+        to outputDir as <number>_<name>.<format>.
+    '''
+    global _renderer, _figureCount
+    import matplotlib.pyplot as plt
+
+    if plotMode == 'off':
+        plt.close(fig)
+        return
+    if plotMode == 'show':
+        plt.show()
+        return
+
+    _figureCount += 1
+    os.makedirs(outputDir, exist_ok=True)
+    fileName = os.path.join(outputDir, '%02d_%s.%s' %(_figureCount, name, fileFormat))
+
+    ## Detach from pyplot so the worker is the only one touching the figure
+    plt.close(fig)
+    if _renderer is None:
+        _renderer = ThreadPoolExecutor(max_workers=1)
+    _pending.append(_renderer.submit(fig.savefig, fileName))
+
+
+def flush():
+    ''' Waits until all figures handed to the worker are written '''
+    while _pending:
+        _pending.pop(0).result()
+
+
+configure(os.environ.get('PLOT_MODE'), os.environ.get('PLOT_DIR'),
+          os.environ.get('PLOT_FORMAT'))
+atexit.register(flush)
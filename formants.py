@@ -0,0 +1,226 @@
+''' Formant feature extraction from the Hillenbrand WAV recordings for the
+    classification project in TTT4275 - EDC
+
+    Measures the same quantities as vowdata.dat directly from the sound files
+    in Data/Wovels/{men,women,kids}, using the vowel nucleus boundaries and
+    steady-state times in timedata.dat:
+        duration, F0 and F1-F4 at steady state, F1-F3 at 20, 50 and 80 %
+        of the vowel duration
+    F0 is found by autocorrelation and formants from the roots of an LPC
+    polynomial. Files are read memory-mapped and processed in a process pool.
+    The features of every file are cached on disk, keyed by the file's mtime
+    and size and its time marks, so a re-run only processes new or changed
+    files. loadData returns arrays in the same layout as vowels.loadData.
+
+    Usage: python formants.py [--workers N]
+'''
+
+import argparse
+import glob
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.io import wavfile
+
+import datacache
+
+__location__ = os.path.realpath(
+    os.path.join(os.getcwd(), os.path.dirname(__file__)))
+
+wovelDir = os.path.join(__location__, 'Data/Wovels')
+timeDataLoc = os.path.join(wovelDir, 'timedata.dat')
+featureCacheDir = os.path.join(wovelDir, '.cache', 'formants')
+
+speakerDirs = {'m': 'men', 'w': 'women', 'b': 'kids', 'g': 'kids'}
+nColumns = 15           ## Numeric columns, as in vowdata.dat
+frameLength = 0.025     ## Seconds, formant analysis window
+pitchFrameLength = 0.04 ## Seconds, F0 analysis window
+pitchRange = (60, 500)  ## Hz
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Formant extraction from WAV files")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    types, data = extractCorpus(nWorkers=args.workers)
+    print("Extracted features from %d files" %len(types))
+
+
+def loadData(features, nWorkers=None):
+    ''' Same as vowels.loadData, with features measured from the WAV files.
+        Features are column numbers as in vowdata.dat (0 is the file name).
+    '''
+    types, data = extractCorpus(nWorkers=nWorkers)
+    return types, data[:, [val-1 for val in features]]
+
+
+def loadTimeData(timeLoc=timeDataLoc):
+    ''' Reads timedata.dat into dict file name -> (start, end, center1, center2)
+        in milliseconds
+    '''
+    times = {}
+    with open(timeLoc) as timeFile:
+        for line in timeFile:
+            fields = line.split()
+            if len(fields) == 5 and fields[0] != 'File':
+                times[fields[0]] = tuple(float(val) for val in fields[1:])
+    return times
+
+
+def wavLocation(name):
+    ''' Path of the WAV file for file name like 'm01ae' '''
+    return os.path.join(wovelDir, speakerDirs[name[0]], name + '.wav')
+
+
+def extractCorpus(names=None, nWorkers=None):
+    ''' Features of every file in names (all files in timedata.dat with a WAV
+        file if None). Returns file names and int16 array with the 15 numeric
+        columns of vowdata.dat, zero where not measurable.
+    '''
+    times = loadTimeData()
+    if names is None:
+        names = [name for name in sorted(times) if os.path.exists(wavLocation(name))]
+
+    data = np.zeros((len(names), nColumns), dtype=np.int16)
+
+    ## Only files not in the cache are processed
+    missing = []
+    for i, name in enumerate(names):
+        cacheLoc = featureCacheLocation(name, times[name])
+        if os.path.exists(cacheLoc):
+            data[i] = np.load(cacheLoc)
+        else:
+            missing.append(i)
+
+    if missing:
+        args = [(wavLocation(names[i]), times[names[i]]) for i in missing]
+        with ProcessPoolExecutor(max_workers=nWorkers) as executor:
+            results = executor.map(extractFeatures, *zip(*args), chunksize=16)
+            for i, features in zip(missing, results):
+                data[i] = features
+                saveFeatureCache(names[i], times[names[i]], features)
+
+    return np.array(names), data
+
+
+def featureCacheLocation(name, fileTimes):
+    ''' Cache file for features of one WAV file and its time marks '''
+    key = hashlib.sha1(('%s:%s' %(datacache.sourceKey(wavLocation(name)),
+                                  fileTimes)).encode()).hexdigest()[:16]
+    return os.path.join(featureCacheDir, '%s-%s.npy' %(name, key))
+
+
+def saveFeatureCache(name, fileTimes, features):
+    ''' Saves features of one file to the cache and removes its entries for
+        older versions of the WAV file or time marks. Skipped if the cache is
+        not writable.
+    '''
+    cacheLoc = featureCacheLocation(name, fileTimes)
+    try:
+        os.makedirs(featureCacheDir, exist_ok=True)
+        np.save(cacheLoc, features)
+    except OSError:
+        return
+
+    for oldLoc in glob.glob(os.path.join(featureCacheDir, glob.escape(name) + '-*.npy')):
+        if oldLoc != cacheLoc:
+            try:
+                os.remove(oldLoc)
+            except OSError:
+                pass
+
+
+def extractFeatures(wavLoc, fileTimes):
+    ''' Measures the vowdata.dat columns for one WAV file '''
+    sampleRate, signal = wavfile.read(wavLoc, mmap=True)
+    start, end, center1, center2 = fileTimes
+    duration = end-start
+
+    ## Steady state is the mean of the judges' times, or mid vowel if missing
+    centers = [center for center in (center1, center2) if center > 0]
+    steadyState = np.mean(centers) if centers else start+duration/2
+
+    features = np.zeros(nColumns)
+    features[0] = duration
+    features[1] = estimateF0(signal, sampleRate, steadyState/1000)
+    features[2:6] = estimateFormants(signal, sampleRate, steadyState/1000, 4)
+    for i, fraction in enumerate((0.2, 0.5, 0.8)):
+        time = (start+fraction*duration)/1000
+        features[6+3*i:9+3*i] = estimateFormants(signal, sampleRate, time, 3)
+
+    return np.round(features).astype(np.int16)
+
+
+def getFrame(signal, sampleRate, time, length):
+    ''' Frame of length seconds centered at time seconds, as float '''
+    nFrame = int(length*sampleRate)
+    first = max(0, min(int(time*sampleRate)-nFrame//2, len(signal)-nFrame))
+    return np.asarray(signal[first:first+nFrame], dtype=float)
+
+
+def estimateF0(signal, sampleRate, time):
+    ''' F0 in Hz from autocorrelation peak, 0 if unvoiced '''
+    frame = getFrame(signal, sampleRate, time, pitchFrameLength)
+    frame = frame-frame.mean()
+    autocorrelation = np.correlate(frame, frame, mode='full')[len(frame)-1:]
+    if autocorrelation[0] <= 0:
+        return 0
+
+    minLag = int(sampleRate/pitchRange[1])
+    maxLag = min(int(sampleRate/pitchRange[0]), len(frame)-1)
+    lag = minLag + np.argmax(autocorrelation[minLag:maxLag])
+
+    ## Weak periodicity means no reliable F0
+    if autocorrelation[lag] < 0.3*autocorrelation[0]:
+        return 0
+    return sampleRate/lag
+
+
+def estimateFormants(signal, sampleRate, time, nFormants):
+    ''' Lowest nFormants formant frequencies in Hz from LPC roots, 0 for
+        formants not found
+    '''
+    frame = getFrame(signal, sampleRate, time, frameLength)
+    frame = np.append(frame[0], frame[1:]-0.97*frame[:-1]) ## Pre-emphasis
+    frame *= np.hamming(len(frame))
+
+    order = 2 + sampleRate//1000
+    a = lpcCoefficients(frame, order)
+    roots = np.roots(a)
+    roots = roots[np.imag(roots) > 0]
+
+    frequencies = np.angle(roots)*sampleRate/(2*np.pi)
+    bandwidths = -np.log(np.abs(roots))*sampleRate/np.pi
+    frequencies = np.sort(frequencies[(frequencies > 90) & (bandwidths < 400)])
+
+    formants = np.zeros(nFormants)
+    formants[:min(nFormants, len(frequencies))] = frequencies[:nFormants]
+    return formants
+
+
+def lpcCoefficients(frame, order):
+    ''' LPC polynomial [1, a1, ..., a_order] by the autocorrelation method
+        (Levinson-Durbin recursion)
+    '''
+    autocorrelation = np.correlate(frame, frame, mode='full')[len(frame)-1:len(frame)+order]
+    a = np.zeros(order+1)
+    a[0] = 1
+    error = autocorrelation[0]
+    if error <= 0:
+        return a
+
+    for i in range(1, order+1):
+        reflection = -np.dot(a[:i], autocorrelation[i:0:-1])/error
+        a[1:i+1] = a[1:i+1] + reflection*a[i-1::-1][:i]
+        error *= 1-reflection**2
+        if error <= 0:
+            break
+
+    return a
+
+
+if __name__ == '__main__':
+    main()
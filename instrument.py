@@ -0,0 +1,150 @@
+''' Instrumentation of the hot paths in the classification project in
+    TTT4275 - EDC
+
+    Per-stage timers and counters (samples processed, iterations, pdf
+    evaluations), optionally with cProfile and tracemalloc capture (peak
+    memory per stage, incl. numpy arrays), reported as JSON at the end of
+    iris.main / vowels.main. Turned on with the
+    environment variable (or configure() / the --profile flag of the scripts)
+        PROFILE     = 1 | cprofile | tracemalloc | cprofile,tracemalloc
+        PROFILE_OUT = file for the JSON report (printed if not set)
+    When turned off, stage() and count() return at once, so the hooks can stay
+    in the code.
+'''
+
+import contextlib
+import functools
+import json
+import os
+import time
+
+enabled = False
+useCProfile = False
+useTracemalloc = False
+
+_stages = {}
+_counters = {}
+_stack = []
+_profiler = None
+_nullStage = contextlib.nullcontext()
+
+
+def configure(setting):
+    ''' Turns instrumentation on from setting like '1', 'cprofile' or
+        'cprofile,tracemalloc', off for None, '' or '0'
+    '''
+    global enabled, useCProfile, useTracemalloc, _profiler
+    options = set((setting or '').lower().split(',')) - {'', '0'}
+    enabled = bool(options)
+    useCProfile = 'cprofile' in options
+    useTracemalloc = 'tracemalloc' in options
+
+    _stages.clear()
+    _counters.clear()
+    if useCProfile:
+        import cProfile
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    if useTracemalloc:
+        import tracemalloc
+        tracemalloc.start()
+
+
+def stage(name):
+    ''' Context manager timing a stage, e.g. with instrument.stage('training'): '''
+    if not enabled:
+        return _nullStage
+    return _timedStage(name)
+
+
+def timed(name):
+    ''' Decorator timing every call of a function as stage name '''
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            with _timedStage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def configureFromArgs(argv):
+    ''' Turns instrumentation on for a --profile or --profile=<setting> flag '''
+    for arg in argv:
+        if arg == '--profile' or arg.startswith('--profile='):
+            configure(arg.partition('=')[2] or os.environ.get('PROFILE') or '1')
+
+
+@contextlib.contextmanager
+def _timedStage(name):
+    if useTracemalloc:
+        import tracemalloc
+        current, peak = tracemalloc.get_traced_memory()
+        ## Peak so far belongs to the enclosing stage, before it is reset
+        if _stack:
+            _stack[-1]['peak'] = max(_stack[-1]['peak'], peak)
+        tracemalloc.reset_peak()
+        _stack.append({'start': current, 'peak': current})
+    startTime = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter()-startTime
+        entry = _stages.setdefault(name, {'calls': 0, 'seconds': 0.0})
+        entry['calls'] += 1
+        entry['seconds'] += elapsed
+
+        if useTracemalloc:
+            ## Peak of this stage includes peaks of stages inside it, counted
+            ## from the memory in use when the stage started
+            memory = _stack.pop()
+            peak = max(tracemalloc.get_traced_memory()[1], memory['peak'])
+            entry['peakMemory'] = max(entry.get('peakMemory', 0), peak-memory['start'])
+            if _stack:
+                _stack[-1]['peak'] = max(_stack[-1]['peak'], peak)
+            tracemalloc.reset_peak()
+
+
+def count(name, n=1):
+    ''' Adds n to counter name '''
+    if enabled:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def report(script):
+    ''' Emits JSON report of stages, counters and (optional) top cProfile
+        functions, to PROFILE_OUT or printed
+    '''
+    if not enabled:
+        return None
+
+    import precision
+    result = {'script': script, 'precision': precision.dtype.name,
+              'stages': _stages, 'counters': _counters}
+
+    if useTracemalloc:
+        import tracemalloc
+        result['currentMemory'] = tracemalloc.get_traced_memory()[0]
+    if useCProfile:
+        import pstats
+        _profiler.disable()
+        stats = pstats.Stats(_profiler).sort_stats('cumulative')
+        result['profile'] = [
+            {'function': '%s:%d(%s)' %function, 'calls': nCalls,
+             'totalSeconds': totalTime, 'cumulativeSeconds': cumulativeTime}
+            for function, (_, nCalls, totalTime, cumulativeTime, _) in
+            sorted(stats.stats.items(), key=lambda item: -item[1][3])[:30]]
+
+    text = json.dumps(result, indent=2)
+    reportLoc = os.environ.get('PROFILE_OUT')
+    if reportLoc:
+        with open(reportLoc, 'w') as reportFile:
+            reportFile.write(text)
+    else:
+        print(text)
+    return result
+
+
+configure(os.environ.get('PROFILE'))
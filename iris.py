@@ -2,13 +2,21 @@
     by Einar Avdem & Martin Ericsson
 '''
 
-import math
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.patches as mpatches
 import os
-import pandas as pd
-import seaborn as sns
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import datacache
+import evaluation
+import figures
+import instrument
+import precision
+
+## matplotlib, pandas and seaborn are imported in the plotting functions only,
+## so training and testing without figures start fast
 
 __location__ = os.path.realpath(
     os.path.join(os.getcwd(), os.path.dirname(__file__)))
@@ -21,6 +29,10 @@ nFeatures = 4
 classLabels = ['Setosa','Versicolor','Virginica']
 features = ['Sepal length', 'Sepal width', 'Petal length', 'Petal width']
 
+## Largest training set trained stacked by trainingStacked, larger ones are
+## memory bound when stacked and are trained one model at a time
+stackedMaxSamples = 2000
+
 
 def main():
     print("Loading iris dataset...")
@@ -44,7 +56,7 @@ def main():
     #print("test", testingData)
     print("Training classifier with %d iterations and %d training " \
             "samples from each class." %(nIterations, nTraining))
-    W = training(trainingData, nIterations)
+    W, _ = training(trainingData, nIterations)
 
     print("Plotting confusion matrix and finding error rate for training data...")
     confMatrix = confusionMatrixCalc(W, trainingData)
@@ -59,7 +71,7 @@ def main():
 
     print("Training classifier with %d iterations and %d training " \
             "samples, using %d last samples." %(nIterations, nTraining, nTraining))
-    W = training(trainingData, nIterations)
+    W, _ = training(trainingData, nIterations)
 
     print("Plotting confusion matrix and finding error rate for training data...")
     confMatrix = confusionMatrixCalc(W, trainingData)
@@ -83,7 +95,7 @@ def main():
     print("Training classifier with %d iterations and %d training " \
          "samples, using %d last samples." %(nIterations, nTraining, nTraining))
 
-    W = training(trainingData, nIterations)
+    W, _ = training(trainingData, nIterations)
 
     print("Plotting confusion matrix and finding error rate for training data...")
     confMatrix = confusionMatrixCalc(W, trainingData)
@@ -101,7 +113,7 @@ def main():
     print("Training classifier with %d iterations and %d training " \
          "samples, using %d last samples." %(nIterations, nTraining, nTraining))
 
-    W = training(trainingData, nIterations)
+    W, _ = training(trainingData, nIterations)
     print("Weight matrix", W)
 
     print("Plotting confusion matrix and finding error rate for training data...")
@@ -120,7 +132,7 @@ def main():
     print("Training classifier with %d iterations and %d training " \
          "samples, using %d last samples." %(nIterations, nTraining, nTraining))
 
-    W = training(trainingData, nIterations)
+    W, _ = training(trainingData, nIterations)
     print("Weight matrix", W)
 
     print("Plotting confusion matrix and finding error rate for training data...")
@@ -131,10 +143,24 @@ def main():
     confMatrix2 = confusionMatrixCalc(W, testingData)
     plotConfusionMatrix(confMatrix2, len(trainingData[0])-2)
 
+    ## Automatic alternative to the manual feature removal above
+    print("Searching all feature subsets...")
+    ranking = featureSubsetSearch(normalize(rawData), nTraining, nIterations)
+    printSubsetRanking(ranking)
+
+    with instrument.stage('render'):
+        figures.flush()
+    instrument.report('iris')
+
 
 def scatterPlot(data):
     ''' Makes 2x2 scatter plot of iris data comparing some of the features
     '''
+    if not figures.enabled():
+        return
+    import matplotlib.pyplot as plt
+    import pandas as pd
+    import seaborn as sns
 
     col=['Sepal length [cm]','Sepal width [cm]','Petal length [cm]','Petal width [cm]','Species']
     iris = pd.DataFrame(data, columns=col)
@@ -160,7 +186,7 @@ def scatterPlot(data):
     #petal width vs sepal length
     pwp = sns.scatterplot(ax=axes[1,1], data=iris, hue="Species", x="Petal width [cm]", y="Sepal length [cm]", palette='copper')
     pwp.legend(title='Species', loc='upper left', prop={'size': 6})
-    plt.show()
+    figures.output(fig, 'scatter')
 
 
 def findErrorRate(X):
@@ -171,14 +197,21 @@ def findErrorRate(X):
 
 def normalize(data):
     ''' Normalizes the feature values in dataset  '''
-    tempFeatures = data[:, :-1]
-    tempClass = data[:,-1:]
-    tempFeatures = tempFeatures/tempFeatures.max(axis=0)
-    data = np.append(tempFeatures, tempClass, axis=1)
+    data = data.copy()
+    data[:, :-1] /= featureScale(data)
     return data
 
 
-def training(trainingData, nIterations, alpha = 0.04):
+def featureScale(data):
+    ''' Normalization constants (max value of each feature) used by normalize,
+        saved with the model to normalize new samples the same way
+    '''
+    return data[:, :-1].max(axis=0)
+
+
+@instrument.timed('training')
+def training(trainingData, nIterations, alpha = 0.04, tol = None, patience = 10, verbose = True,
+             optimizer = 'gd'):
 
     ''' Training algorithm built from theory and guide in compendium
 
@@ -186,87 +219,283 @@ def training(trainingData, nIterations, alpha = 0.04):
             - G = Gradient
             - MSE = Mean Square Error
             - g_W_MSE = MSE of gradient to output vector
-            - xk = Current input vector
-            - zk = W*xk from compendium
-            - gk = sigmoid of zk
-            - tk = target vector containing class ID for current input vector
+            - X = Input vectors, one row per training sample
+            - T = One-hot target vectors, one row per training sample
 
-    '''
+        The full epoch is computed in one go by gradientStep, which gives
+        the same W and MSE as summing sample by sample.
 
+        optimizer is one of optimizers.methods. 'gd' is the fixed step
+        gradient descent of the compendium (Eq 23), the others minimize the
+        same MSE (Eq 19) with the exact gradient from exactGradientStep, and
+        need far fewer iterations.
+
+        nIterations is the maximum number of iterations. If tol is given,
+        training stops when the relative MSE change has been below tol for
+        patience iterations in a row. Returns W and the number of iterations
+        actually run. verbose = False skips MSE plot and printing of W.
+    '''
+    import optimizers
 
     nFeatures = trainingData.shape[1]-2
-    W = np.zeros((nClasses, nFeatures+1))
-    tk_temp = np.zeros((nClasses, 1))
-    gk = np.zeros((nClasses))
-    MSE = np.zeros(nIterations)
 
-    for i in range(nIterations):
-        G_W_MSE = 0
+    ## Whole epoch as matrices: one row per sample
+    X = trainingData[:, :-1]
+    T = targetMatrix(trainingData[:, -1])
+
+    ## Optimizers work on W as flat vector
+    step = gradientStep if optimizer == 'gd' else exactGradientStep
+    def objective(w):
+        G_W_MSE, MSE = step(w.reshape(nClasses, nFeatures+1), X, T)
+        return MSE, G_W_MSE.ravel()
+
+    # Moving W in opposite direction of the gradient Eq 23 in compendium
+    w, MSE = optimizers.minimize(objective, np.zeros(nClasses*(nFeatures+1), dtype=X.dtype), optimizer,
+                                 nIterations, alpha, tol, patience)
+    W = w.reshape(nClasses, nFeatures+1)
 
-        for xk in trainingData: ## Iterating through each sample
+    nIterationsUsed = len(MSE)
+    instrument.count('trainingIterations', nIterationsUsed)
+    instrument.count('trainingSamplesProcessed', nIterationsUsed*len(X))
+
+    if not verbose:
+        return W, nIterationsUsed
+
+    ## Plotting MSE convergence
+    if figures.enabled():
+        import matplotlib.pyplot as plt
+        fig = plt.figure()
+        plt.title("MSE converging over %d iterations (%s) "\
+                  "when %d features are used" %(nIterationsUsed, optimizer, nFeatures))
+        plt.plot(MSE)
+
+        # Textbox with final MSE converging value
+        mseval = MSE[-1] ## Get last value in MSE array
+        textBox = dict(boxstyle='round', facecolor='white', alpha=0.5)
+        plt.annotate('\n MSE converging value: %.2f \n' %mseval, xy=(0.56, 0.84), xycoords='axes fraction', bbox=textBox)
+        figures.output(fig, 'mse')
+
+    print("Optimizer %s: MSE = %.4f after %d iterations" %(optimizer, MSE[-1], nIterationsUsed))
+    print("Weight matrix = ", W)
+    return W, nIterationsUsed
 
-            zk = np.matmul(W,(xk[:-1]))[np.newaxis].T
-            gk = sigmoid(zk)
 
-            ## Update target vector
-            tk_temp *= 0
-            tk_temp[int(xk[-1]),:] = 1
-            tk = tk_temp
 
-            # Finding gradients for MSE calculation
-            G_gk_MSE = gk-tk
-            G_zk_g = np.multiply(gk, (1-gk))
-            G_W_zk = xk[:-1].reshape(1,nFeatures+1)
+@instrument.timed('training')
+def trainingStacked(trainingSets, nIterations, alpha = 0.04, featureMasks = None):
+    ''' Trains one classifier per training set in a single loop, updating a
+        stacked weight tensor W of shape (nModels, nClasses, nFeatures+1).
 
-            G_W_MSE += np.matmul(np.multiply(G_gk_MSE, (1-gk)), G_W_zk) ## Eq 22 in compendium
+        trainingSets is a list of arrays in the trainingData layout with the
+        same columns, e.g. splits with and without Flip. Sets with fewer
+        samples are padded with samples of zero weight. alpha is one step
+        size or one per model. featureMasks is an optional (nModels,
+        nFeatures) array of 0/1, used instead of removeFeatures: masked
+        features are zeroed, so their weights stay zero and the other weights
+        are the same as when training without those columns.
 
-            MSE[i] += 0.5* np.matmul((gk-tk).T,(gk-tk)) ## Eq 19 in compendium
+        The stacked loop pays off for many small models like the iris data.
+        Sets with more than stackedMaxSamples samples are trained one model at
+        a time, with the same result.
 
+        Returns W and MSE per model and iteration, shape (nModels, nIterations).
+    '''
+    nModels = len(trainingSets)
+    dtype = trainingSets[0].dtype
+    nInputs = trainingSets[0].shape[1]-1
+    inputMasks = np.ones((nModels, nInputs), dtype=dtype)
+    if featureMasks is not None:
+        ## Dummy input is never masked
+        inputMasks[:, :-1] = featureMasks
+
+    alpha = np.broadcast_to(np.asarray(alpha, dtype=dtype), (nModels,))[:, np.newaxis, np.newaxis]
+    W = np.zeros((nModels, nClasses, nInputs), dtype=dtype)
+    MSE = np.zeros((nModels, nIterations))
+
+    if max(len(data) for data in trainingSets) > stackedMaxSamples:
+        for k, data in enumerate(trainingSets):
+            X = data[:, :-1]*inputMasks[k]
+            T = targetMatrix(data[:, -1])
+            for i in range(nIterations):
+                G_W_MSE, MSE[k, i] = gradientStep(W[k], X, T)
+                W[k] -= alpha[k]*G_W_MSE
+        instrument.count('trainingIterations', nModels*nIterations)
+        instrument.count('trainingSamplesProcessed',
+                         sum(len(data) for data in trainingSets)*nIterations)
+        return W, MSE
+
+    X, T, sampleWeights = stackTrainingSets(trainingSets)
+    X = X*inputMasks[:, np.newaxis, :]
 
-        # Moving W in opposite direction of the gradient Eq 23 in compendium
+    for i in range(nIterations):
+        G_W_MSE, MSE[:, i] = gradientStepStacked(W, X, T, sampleWeights)
         W -= alpha*G_W_MSE
 
-    ## Plotting MSE convergence
-    plt.figure()
-    plt.title("MSE converging over %d iterations "\
-              "when %d features are used" %(nIterations, nFeatures))
-    plt.plot(MSE)
+    instrument.count('trainingIterations', nModels*nIterations)
+    instrument.count('trainingSamplesProcessed', int(sampleWeights.sum())*nIterations)
+    return W, MSE
 
-    # Textbox with final MSE converging value
-    mseval = MSE[-1] ## Get last value in MSE array
-    textBox = dict(boxstyle='round', facecolor='white', alpha=0.5)
-    plt.annotate('\n MSE converging value: %.2f \n' %mseval, xy=(0.56, 0.84), xycoords='axes fraction', bbox=textBox)
-    plt.show()
 
-    print("Weight matrix = ", W)
-    return W
+def stackTrainingSets(trainingSets):
+    ''' Stacks training sets into inputs X (nModels, nSamples, nFeatures+1),
+        one-hot targets T and sample weights (1 for samples, 0 for padding)
+    '''
+    nSamples = max(len(data) for data in trainingSets)
+    nInputs = trainingSets[0].shape[1]-1
+    dtype = trainingSets[0].dtype
+    X = np.zeros((len(trainingSets), nSamples, nInputs), dtype=dtype)
+    T = np.zeros((len(trainingSets), nSamples, nClasses), dtype=dtype)
+    sampleWeights = np.zeros((len(trainingSets), nSamples), dtype=dtype)
+    for k, data in enumerate(trainingSets):
+        X[k, :len(data)] = data[:, :-1]
+        T[k, :len(data)] = targetMatrix(data[:, -1])
+        sampleWeights[k, :len(data)] = 1
+    return X, T, sampleWeights
+
+
+def gradientStepStacked(W, X, T, sampleWeights):
+    ''' gradientStep for stacked models: W (nModels, nClasses, nFeatures+1),
+        X, T and sampleWeights as from stackTrainingSets. Returns gradient and
+        summed MSE of every model.
+    '''
+    gk = sigmoid(np.matmul(X, np.swapaxes(W, -1, -2)))
+    G_gk_MSE = (gk-T)*sampleWeights[..., np.newaxis]
+
+    G_W_MSE = np.matmul(np.swapaxes(G_gk_MSE*(1-gk), -1, -2), X) ## Eq 22 in compendium
+    MSE = 0.5*np.sum(G_gk_MSE**2, axis=(1, 2)) ## Eq 19 in compendium
+    return G_W_MSE, MSE
 
 
+@instrument.timed('training')
+def trainingSGD(batchSource, nEpochs, alpha = 0.04, schedule = None):
+    ''' Mini-batch / online version of the training algorithm for data that
+        does not fit in memory.
 
+        batchSource is called with the epoch number and must return an iterable
+        of batches in the same layout as trainingData (features, dummy input,
+        class ID), e.g. iterateBatches on an array or np.memmap, or a chunked
+        reader. Batches of one sample gives online training.
+
+        schedule is an optional function of the epoch number returning the
+        learning rate, see learningRateSchedule. Returns W, MSE per epoch
+        and throughput in samples/s per epoch.
+    '''
+    W = None
+    MSE = np.zeros(nEpochs)
+    throughput = np.zeros(nEpochs)
+
+    for epoch in range(nEpochs):
+        stepSize = alpha if schedule is None else schedule(epoch)
+        nSamples = 0
+        startTime = time.perf_counter()
+
+        for batch in batchSource(epoch):
+            if W is None:
+                W = np.zeros((nClasses, batch.shape[1]-1), dtype=batch.dtype)
+            G_W_MSE, batchMSE = gradientStep(W, batch[:, :-1], targetMatrix(batch[:, -1]))
+            W -= stepSize*G_W_MSE
+            MSE[epoch] += batchMSE
+            nSamples += len(batch)
+            instrument.count('trainingIterations')
+
+        throughput[epoch] = nSamples/(time.perf_counter()-startTime)
+        instrument.count('trainingSamplesProcessed', nSamples)
+        print("Epoch %d: MSE = %.3f, %.0f samples/s" %(epoch, MSE[epoch], throughput[epoch]))
+
+    return W, MSE, throughput
+
+
+def iterateBatches(data, batchSize, seed = None):
+    ''' Generator yielding batches of batchSize rows from data. Rows are
+        shuffled with the given seed, or read in order if seed is None.
+        Works on np.memmap arrays, only one batch is read into memory at a time.
+    '''
+    if seed is None:
+        for start in range(0, len(data), batchSize):
+            yield np.asarray(data[start:start+batchSize])
+    else:
+        order = np.random.default_rng(seed).permutation(len(data))
+        for start in range(0, len(data), batchSize):
+            yield np.asarray(data[np.sort(order[start:start+batchSize])])
+
+
+def learningRateSchedule(alpha, decay = 0.0):
+    ''' Learning rate schedule alpha/(1 + decay*epoch) for trainingSGD '''
+    return lambda epoch: alpha/(1+decay*epoch)
+
+
+def targetMatrix(classIDs):
+    ''' Builds one-hot target vectors (one row per sample) from class IDs '''
+    return np.eye(nClasses, dtype=precision.dtype)[classIDs.astype(int)]
+
+
+def gradientStep(W, X, T):
+    ''' Forward pass, gradient and MSE for a batch of samples at once
+
+        Variables:
+            - X = Input vectors xk, one row per sample (incl. dummy input)
+            - T = Target vectors tk, one row per sample
+            - zk = W*xk for every sample
+            - gk = sigmoid of zk
+
+        Returns gradient of W summed over the batch and the summed MSE.
+    '''
+    zk = np.matmul(X, W.T)
+    gk = sigmoid(zk)
+    G_gk_MSE = gk-T
+
+    G_W_MSE = np.matmul(np.multiply(G_gk_MSE, (1-gk)).T, X) ## Eq 22 in compendium
+    MSE = 0.5*np.sum(G_gk_MSE**2) ## Eq 19 in compendium
+    return G_W_MSE, MSE
+
+
+def exactGradientStep(W, X, T):
+    ''' Like gradientStep, but with the exact gradient of the MSE (Eq 19),
+        including the derivative gk*(1-gk) of the sigmoid, as needed by line
+        searches and quasi-Newton optimizers
+    '''
+    gk = sigmoid(np.matmul(X, W.T))
+    G_gk_MSE = gk-T
+
+    G_W_MSE = np.matmul((G_gk_MSE*gk*(1-gk)).T, X)
+    MSE = 0.5*np.sum(G_gk_MSE**2)
+    return G_W_MSE, MSE
+
+
+@instrument.timed('testing')
 def confusionMatrixCalc(W, data):
     ''' Function which calculates the confusion matrix
         by using weight matrix to predict the classes of testing samples.
+        Predicted class along rows, actual class along columns.
     '''
+    ## Predicting class of all samples by using weight matrix
+    classPrediction = predictClasses(W, data)
+    ## Retreiving actual class
+    classActual = data[:, -1].astype(int)
+    instrument.count('testSamples', len(data))
 
-    confusionMatrix = np.zeros((nClasses, nClasses), dtype='int')
-
-    for i in range(len(data)):
-        ## Predicting class by using weight matrix
-        classPrediction = int(np.argmax(np.matmul(W, data[i,0:data.shape[1]-1])))
-        ## Retreiving actual class
-        classActual = int(data[i, -1])
-        ## Adding prediction to confusion matrix
-        confusionMatrix[classPrediction, classActual] += 1
+    confusionMatrix = evaluation.confusionMatrix(classPrediction, classActual, nClasses)
 
     print("Confusion matrix \n")
     print(confusionMatrix)
     return confusionMatrix
 
 
+def predictClasses(W, data):
+    ''' Predicts class of every sample in data (same layout as trainingData) '''
+    return np.argmax(np.matmul(data[:, :-1], W.T), axis=1)
+
+
 def plotConfusionMatrix(confusionMatrix, nFeatures):
     ''' Function which plots confusion matrix as heat map with
         calculated error rate.
     '''
+    errorRate = findErrorRate(confusionMatrix)
+    print("errorRate = ", errorRate)
+    if not figures.enabled():
+        return
+    import matplotlib.pyplot as plt
+
     ## Plotting
     fig, ax = plt.subplots(figsize=(8, 6.5))
     im = ax.imshow(confusionMatrix, cmap='copper')
@@ -278,8 +507,6 @@ def plotConfusionMatrix(confusionMatrix, nFeatures):
              rotation_mode="anchor")
 
     ## Plotting error rate within heat map
-    errorRate = findErrorRate(confusionMatrix)
-    print("errorRate = ", errorRate)
     textstr = ('Error rate = %.1f %%\n nTraining = 30 \n nFeatures = %d' %(errorRate, nFeatures))
     textBox = dict(boxstyle='round', facecolor='white', alpha=0.5)
     ax.text(0.60, 0.97, textstr, transform=ax.transAxes, fontsize=10,
@@ -294,7 +521,91 @@ def plotConfusionMatrix(confusionMatrix, nFeatures):
     ax.set_title("Heatmap visualizing confusion matrix")
     fig.tight_layout()
     plt.colorbar(im)
-    plt.show()
+    figures.output(fig, 'confusion_matrix')
+
+
+@instrument.timed('featureSubsetSearch')
+def featureSubsetSearch(data, nTraining, nIterations, alpha = 0.04,
+                        method = 'exhaustive', nWorkers = 1, cache = None):
+    ''' Trains and tests the classifier on feature subsets and returns a list of
+        (subset, testing error rate, training error rate) sorted by testing
+        error rate. Feature numbers are as in removeFeatures.
+
+        method:
+            - 'exhaustive' = all non-empty subsets
+            - 'forward' = greedy, adding the best feature one at a time
+            - 'backward' = greedy, removing the least useful feature one at a time
+
+        Data is split once and subsets are column selections of the split.
+        Subsets in a step are trained together by trainingStacked, split over
+        a pool of nWorkers processes if nWorkers > 1.
+        Results are stored in the dict cache, keyed by data, nTraining,
+        nIterations and alpha as well as the subset, so a cache passed to
+        several searches is reused between them where the settings match.
+        The search itself is evaluation.subsetSearch.
+    '''
+    if cache is None:
+        cache = {}
+    trainingData, testingData = splitData(data, nTraining)
+    allFeatures = tuple(range(data.shape[1]-1))
+
+    def evaluate(subsets):
+        ## All subsets of a chunk are trained together, one chunk per worker
+        chunkSize = -(-len(subsets)//nWorkers)
+        chunks = [subsets[start:start+chunkSize] for start in range(0, len(subsets), chunkSize)]
+        evaluateChunk = partial(subsetErrorRates, trainingData=trainingData,
+                                testingData=testingData, nIterations=nIterations, alpha=alpha)
+        if len(chunks) > 1:
+            with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+                errorRates = list(executor.map(evaluateChunk, chunks))
+        else:
+            errorRates = [evaluateChunk(chunks[0])]
+        return [subsetRates for chunkRates in errorRates for subsetRates in chunkRates]
+
+    settings = (evaluation.dataKey(data), nTraining, nIterations, alpha)
+    return evaluation.subsetSearch(allFeatures, evaluate, cache, method, settings=settings)
+
+
+def subsetErrorRates(subsets, trainingData, testingData, nIterations, alpha):
+    ''' Trains on the given feature subsets at once (trainingStacked with
+        feature masks) and returns testing and training error rate of each
+    '''
+    nFeatures = trainingData.shape[1]-2
+    featureMasks = np.zeros((len(subsets), nFeatures))
+    for k, subset in enumerate(subsets):
+        featureMasks[k, list(subset)] = 1
+    W, _ = trainingStacked([trainingData]*len(subsets), nIterations, alpha, featureMasks)
+
+    ## Weights of masked features are zero, so the full data can be used
+    results = []
+    for k in range(len(subsets)):
+        errorRates = []
+        for data in (testingData, trainingData):
+            confusionMatrix = evaluation.confusionMatrix(predictClasses(W[k], data),
+                                                         data[:, -1].astype(int), nClasses)
+            errorRates.append(evaluation.errorRate(confusionMatrix))
+        results.append(tuple(errorRates))
+    return results
+
+
+def crossValidationFitPredict(data, labels, trainIndex, testIndex,
+                              nIterations = 4000, alpha = 0.04):
+    ''' Classifier for crossvalidation.crossValidate. data is normalized data
+        (features and class ID columns), labels the class IDs.
+    '''
+    trainingData = addDummyInput(data[trainIndex])
+    testingData = addDummyInput(data[testIndex])
+
+    W, _ = training(trainingData, nIterations, alpha, verbose=False)
+    return predictClasses(W, testingData)
+
+
+def printSubsetRanking(ranking):
+    ''' Prints result of featureSubsetSearch as table '''
+    print("%-55s %10s %10s" %("Features", "Test [%]", "Train [%]"))
+    for subset, testErrorRate, trainErrorRate in ranking:
+        names = ', '.join(features[i] for i in subset)
+        print("%-55s %10.1f %10.1f" %(names, testErrorRate, trainErrorRate))
 
 
 def removeFeatures(data, featuresToRemove):
@@ -311,6 +622,11 @@ def plotHistograms(data):
     ''' Function for plotting histogram of iris dataset with its classes by
         different features.
     '''
+    if not figures.enabled():
+        return
+    import matplotlib.pyplot as plt
+    import pandas as pd
+    import seaborn as sns
 
     #Parse iris-data and histogramplot datasets in species with features format
     col=['Sepal length [cm]','Sepal width [cm]','Petal length [cm]','Petal width [cm]','Species']
@@ -335,12 +651,15 @@ def plotHistograms(data):
     #petal width
     pwp = sns.histplot(ax=axes[1,1], data=iris, hue="Species", x="Petal width [cm]", kde=True, binwidth=0.1, palette='copper')
     pwp.legend(title='Species', loc='upper right', labels=['Iris virginica', 'Iris versicolor', 'Iris setosa'])
-    plt.show()
+    figures.output(fig, 'histograms')
 
 def sigmoid(x):
     ''' Calculating sigmoid  '''
-    return np.array(1 / (1 + np.exp(-x)))
+    ## exp overflows to inf for large negative x, which still gives 0
+    with np.errstate(over='ignore'):
+        return np.array(1 / (1 + np.exp(-x)))
 
+@instrument.timed('splitData')
 def splitData(data, nTraining, Flip = False):
     '''
         Function for slitting data in to training and testing sub-sets.
@@ -349,48 +668,61 @@ def splitData(data, nTraining, Flip = False):
     '''
 
     ### Constants
-    nFeatures = data.shape[1]-1
     nTest = nSamplesPerClass-nTraining
 
-    ### Preallocate arrays
-    trainingData = np.zeros((nTraining*nClasses, nFeatures+1))
-    testData = np.zeros((nTest*nClasses, nFeatures+1))
+    ### Rows of every class, the 50 values for each class follow each other
+    classRows = np.arange(nSamplesPerClass)
+    classStarts = nSamplesPerClass*np.arange(nClasses)[:, np.newaxis]
 
-    ### Iterating over classes and splitting data
-    for i in range(nClasses):
-        classNdata = data[(i*nSamplesPerClass):((i+1)*nSamplesPerClass), :] ## Gets the 50 values for each class
+    ## For using the N last samples for training
+    if Flip:
+        trainingRows = (classStarts + classRows[nTest:]).ravel()
+    else:
+        trainingRows = (classStarts + classRows[:nTraining]).ravel()
+    testRows = (classStarts + classRows[nTraining:]).ravel()
 
-        ## For using the N last samples for training
-        if Flip:
-            trainingData[(i*nTraining):((i+1)*nTraining),:] = classNdata[nTest:,:]
-            testData[(i*nTest):((i+1)*nTest),:] = classNdata[nTraining:, :]
+    return addDummyInput(data[trainingRows]), addDummyInput(data[testRows])
 
-        else:
-            trainingData[(i*nTraining):((i+1)*nTraining),:] = classNdata[:nTraining,:]
-            testData[(i*nTest):((i+1)*nTest),:] = classNdata[nTraining:, :]
 
-    ## Adding column of ones due (dummy input)
-    testData = np.insert(testData, -1, np.ones(testData.shape[0]), axis = 1)
-    trainingData = np.insert(trainingData, -1, np.ones(trainingData.shape[0]), axis = 1)
+def addDummyInput(data):
+    ''' Adds column of ones (dummy input) before the class ID column, in one
+        allocation with the dtype of data
+    '''
+    result = np.ones((len(data), data.shape[1]+1), dtype=data.dtype)
+    result[:, :-2] = data[:, :-1]
+    result[:, -1] = data[:, -1]
+    return result
 
-    return trainingData, testData
 
 
+@instrument.timed('loadData')
+def loadData(dataLoc=irisDataLoc):
+    ''' Function for reading data from file and assigning class ID.
+        The parsed file is cached, see parseData.
+    '''
+    arrays = datacache.cachedArrays(dataLoc, parseData)
+
+    ## Class ID as last column, as float like the features
+    data = np.column_stack((arrays['features'], arrays['classID'])).astype(precision.dtype)
+    return data
 
-def loadData():
-    ''' Function for reading data from file and assigning class ID '''
 
-    ## Reading from file
-    rawData = np.genfromtxt(irisDataLoc, dtype = str, delimiter=',')
+def parseData(dataLoc):
+    ''' Parses iris data file into feature array and class ID array '''
+
+    ## Reading from file, skipping blank lines
+    with open(dataLoc) as dataFile:
+        lines = [line for line in dataFile if line.strip()]
+    features = np.loadtxt(lines, delimiter=',', usecols=range(nFeatures))
+    names = np.loadtxt(lines, delimiter=',', usecols=nFeatures, dtype=str)
 
     ## Assigning class ID instead of informative string
-    for i, val in enumerate(rawData):
-        classID = 0 if val[-1] == 'Iris-setosa' else 1 if val[-1] == 'Iris-versicolor' else 2
-        rawData[i][4] = classID
+    classID = np.where(names == 'Iris-setosa', 0,
+                       np.where(names == 'Iris-versicolor', 1, 2)).astype(np.int8)
 
-    ## Converting from string to float
-    data = rawData.astype(float)
-    return data
+    return {'features': features, 'classID': classID}
 
 if __name__ == '__main__':
+    instrument.configureFromArgs(sys.argv[1:])
+    precision.configureFromArgs(sys.argv[1:])
     main()
@@ -0,0 +1,167 @@
+''' Gaussian mixture EM for the classification project in TTT4275 - EDC
+
+    Fits one mixture model per class for all classes in a single batched
+    computation. Samples of every class are padded to a (C, N, D) tensor with
+    a mask, and parameters are stacked tensors:
+        means        (C, M, D)
+        covariances  (C, M, D, D) 'full', (C, M, D) 'diag', (C, D, D) 'tied'
+        weights      (C, M)
+    Responsibilities are computed in log space. Initialization is k-means++
+    followed by a few k-means iterations, or given parameters (warm start).
+    Only numpy is needed.
+
+    Shapes: C = classes, M = mixture components, D = features, N = samples.
+'''
+
+import numpy as np
+
+import scoring
+
+
+def fitMixtures(classSamples, M, covType='diag', regCovar=1e-4, maxIterations=100,
+                tol=1e-3, seed=0, init=None):
+    ''' Fits a mixture with M components to the samples of every class.
+
+        classSamples is a list with a (N_c, D) array per class. init is an
+        optional (means, precisions, weights) tuple of stacked tensors as
+        from scoring.mixtureParameters, used instead of k-means++. EM stops
+        when the mean log-likelihood of every class changes less than tol.
+        Returns dict with means, covariances, weights, covType and the
+        number of iterations used.
+    '''
+    X, mask = padSamples(classSamples)
+    nCounts = mask.sum(axis=1)
+
+    if init is None:
+        resp = kmeansResponsibilities(X, mask, M, np.random.default_rng(seed))
+        params = maximization(X, mask, resp, covType, regCovar)
+    else:
+        means, precisions, weights = init
+        covariances = np.linalg.inv(np.asarray(precisions, dtype=float))
+        covariances = 0.5*(covariances + np.swapaxes(covariances, -1, -2))
+        if covType == 'diag':
+            covariances = np.diagonal(covariances, axis1=-2, axis2=-1)
+        elif covType == 'tied':
+            covariances = covariances[:, 0]
+        params = {'means': np.array(means, dtype=float), 'covariances': covariances,
+                  'weights': np.array(weights, dtype=float), 'covType': covType}
+
+    lowerBound = np.full(len(X), -np.inf)
+    for iteration in range(1, maxIterations+1):
+        ## E-step, log responsibilities of every component for every sample
+        componentLL = componentLogLikelihoods(params, X)
+        sampleLL = logSumExp(componentLL, axis=1)
+        resp = np.exp(componentLL - sampleLL[:, np.newaxis]) * mask[:, np.newaxis]
+
+        ## M-step
+        params = maximization(X, mask, resp, covType, regCovar)
+
+        previousBound = lowerBound
+        lowerBound = np.sum(sampleLL*mask, axis=1)/nCounts
+        if np.all(np.abs(lowerBound-previousBound) < tol):
+            break
+
+    params['nIterations'] = iteration
+    return params
+
+
+def padSamples(classSamples):
+    ''' Stacks samples of every class into (C, N, D) with zero padding, and a
+        (C, N) mask which is 1 for real samples
+    '''
+    nMax = max(len(samples) for samples in classSamples)
+    nFeatures = classSamples[0].shape[1]
+    X = np.zeros((len(classSamples), nMax, nFeatures))
+    mask = np.zeros((len(classSamples), nMax))
+    for c, samples in enumerate(classSamples):
+        X[c, :len(samples)] = samples
+        mask[c, :len(samples)] = 1
+    return X, mask
+
+
+def kmeansResponsibilities(X, mask, M, rng, nIterations=10):
+    ''' Hard responsibilities (C, M, N) from k-means++ seeding and k-means,
+        done for all classes at once
+    '''
+    nClasses, nMax, _ = X.shape
+    classIndex = np.arange(nClasses)
+
+    ## k-means++: first center uniformly, then proportional to squared distance
+    first = np.array([rng.integers(mask[c].sum()) for c in range(nClasses)])
+    centers = X[classIndex, first][:, np.newaxis]
+    for _ in range(1, M):
+        distances = squaredDistances(X, centers).min(axis=1)*mask
+        probabilities = distances/distances.sum(axis=1, keepdims=True)
+        chosen = np.array([rng.choice(nMax, p=probabilities[c]) for c in range(nClasses)])
+        centers = np.concatenate((centers, X[classIndex, chosen][:, np.newaxis]), axis=1)
+
+    for _ in range(nIterations):
+        labels = squaredDistances(X, centers).argmin(axis=1)
+        resp = (labels[:, np.newaxis, :] == np.arange(M)[:, np.newaxis]) * mask[:, np.newaxis]
+        counts = resp.sum(axis=2)
+        newCenters = np.matmul(resp, X)/np.maximum(counts, 1)[..., np.newaxis]
+        ## Empty clusters keep their center
+        centers = np.where(counts[..., np.newaxis] > 0, newCenters, centers)
+
+    labels = squaredDistances(X, centers).argmin(axis=1)
+    return (labels[:, np.newaxis, :] == np.arange(M)[:, np.newaxis]) * mask[:, np.newaxis]
+
+
+def squaredDistances(X, centers):
+    ''' Squared distance from every sample to every center, shape (C, M, N) '''
+    return np.sum((X[:, np.newaxis] - centers[:, :, np.newaxis])**2, axis=-1)
+
+
+def maximization(X, mask, resp, covType, regCovar):
+    ''' M-step: weights, means and covariances from responsibilities (C, M, N) '''
+    nFeatures = X.shape[-1]
+    counts = resp.sum(axis=2) + 10*np.finfo(float).eps
+    weights = counts/mask.sum(axis=1, keepdims=True)
+    means = np.matmul(resp, X)/counts[..., np.newaxis]
+
+    if covType == 'diag':
+        ## E[x^2] - mean^2, per feature
+        covariances = np.matmul(resp, X**2)/counts[..., np.newaxis] - means**2 + regCovar
+    elif covType in ('full', 'tied'):
+        diff = X[:, np.newaxis] - means[:, :, np.newaxis]
+        weighted = diff*resp[..., np.newaxis]
+        covariances = np.matmul(np.swapaxes(weighted, -1, -2), diff)
+        if covType == 'tied':
+            covariances = covariances.sum(axis=1)/counts.sum(axis=1)[:, np.newaxis, np.newaxis]
+        else:
+            covariances = covariances/counts[..., np.newaxis, np.newaxis]
+        covariances = covariances + regCovar*np.eye(nFeatures)
+    else:
+        raise ValueError("Unknown covariance type '%s'" %covType)
+
+    return {'means': means, 'covariances': covariances, 'weights': weights, 'covType': covType}
+
+
+def fullCovariances(params):
+    ''' Covariances of params as (C, M, D) for 'diag', else (C, M, D, D) '''
+    covariances = params['covariances']
+    if params['covType'] == 'tied':
+        nComponents = params['means'].shape[1]
+        covariances = np.repeat(covariances[:, np.newaxis], nComponents, axis=1)
+    return covariances
+
+
+def componentLogLikelihoods(params, X):
+    ''' Log of weight times density of every component for every padded
+        sample, shape (C, M, N)
+    '''
+    model = scoringModel(params)
+    meansWhite = np.einsum('cmd,cmed->cme', model['means'], model['precChol'])
+    Y = np.matmul(X[:, np.newaxis], np.swapaxes(model['precChol'], -1, -2)) - meansWhite[:, :, np.newaxis]
+    return model['logNorm'][..., np.newaxis] - 0.5*np.sum(Y**2, axis=-1)
+
+
+def logSumExp(values, axis):
+    ''' log(sum(exp(values))) along axis without overflow '''
+    maxValue = values.max(axis=axis, keepdims=True)
+    return np.squeeze(maxValue, axis) + np.log(np.sum(np.exp(values-maxValue), axis=axis))
+
+
+def scoringModel(params):
+    ''' Scoring model (scoring.buildScoringModel) from fitted parameters '''
+    return scoring.buildScoringModel(params['means'], fullCovariances(params), params['weights'])
@@ -0,0 +1,74 @@
+''' Saving and loading trained classifiers for the classification project in
+    TTT4275 - EDC
+
+    Models are stored as uncompressed .npz files with plain arrays only (no
+    pickled objects), so they can be loaded for inference with numpy alone,
+    without retraining and without importing scipy or pandas.
+
+    Iris model:   W, feature scale (normalization constants), feature
+                  indices and class labels.
+    Vowel model:  scoring model from scoring.buildScoringModel (means,
+                  precision Cholesky factors, log normalization incl. mixture
+                  weights), feature column numbers and class labels.
+    Vowel statistics: per-vowel count, sum and sum of outer products for
+                  incremental updates, feature column numbers and class labels.
+'''
+
+import numpy as np
+
+import scoring
+
+scoringKeys = ('means', 'precChol', 'logNorm')
+
+
+def saveIrisModel(fileLoc, W, scale, featureIndices, classLabels):
+    ''' Saves iris weight matrix with what is needed to classify raw samples '''
+    np.savez(fileLoc, kind='iris', W=W, scale=scale,
+             features=np.asarray(featureIndices, dtype=int),
+             classLabels=np.asarray(classLabels, dtype=str))
+
+
+def saveVowelModel(fileLoc, scoringModel, features, classLabels):
+    ''' Saves vowel scoring model with feature columns and class labels '''
+    np.savez(fileLoc, kind='vowels',
+             features=np.asarray(features, dtype=int),
+             classLabels=np.asarray(classLabels, dtype=str),
+             **{key: scoringModel[key] for key in scoringKeys})
+
+
+def saveVowelStatistics(fileLoc, stats, features, classLabels):
+    ''' Saves per-vowel sufficient statistics (vowels.classStatistics) so the
+        single Gaussian models can be updated with new recordings later
+    '''
+    np.savez(fileLoc, kind='vowelStatistics',
+             features=np.asarray(features, dtype=int),
+             classLabels=np.asarray(classLabels, dtype=str), **stats)
+
+
+def loadModel(fileLoc):
+    ''' Loads a saved model into a dict of arrays, 'kind' is 'iris', 'vowels'
+        or 'vowelStatistics'
+    '''
+    with np.load(fileLoc, allow_pickle=False) as modelFile:
+        model = {key: modelFile[key] for key in modelFile.files}
+    model['kind'] = str(model['kind'])
+    return model
+
+
+def predict(model, X):
+    ''' Predicts class index for every row of raw features in X, where the
+        columns are the model's features in the same order.
+    '''
+    X = np.atleast_2d(np.asarray(X, dtype=float))
+
+    if model['kind'] == 'iris':
+        ## Normalizing and adding dummy input like in training
+        X = np.append(X/model['scale'], np.ones((len(X), 1)), axis=1)
+        return np.argmax(np.matmul(X, model['W'].T), axis=1)
+
+    return scoring.predictClasses(model, X)
+
+
+def predictLabels(model, X):
+    ''' Predicts class label for every row of raw features in X '''
+    return model['classLabels'][predict(model, X)]
@@ -0,0 +1,167 @@
+''' Gradient based optimizers for the classification project in TTT4275 - EDC
+
+    Minimizes an objective given as a function of a flat parameter vector
+    that returns the objective value and its gradient, e.g. the MSE of the
+    iris classifier (Eq 19 in compendium). Methods:
+        - 'gd' = gradient descent with fixed step size alpha
+        - 'momentum' = heavy ball momentum
+        - 'nesterov' = Nesterov accelerated gradient
+        - 'adam' = Adam, step size alpha per parameter
+        - 'linesearch' = gradient descent with backtracking line search
+        - 'lbfgs' = limited memory BFGS with backtracking line search
+    Only numpy is needed.
+'''
+
+import numpy as np
+
+import instrument
+
+methods = ('gd', 'momentum', 'nesterov', 'adam', 'linesearch', 'lbfgs')
+
+
+def minimize(objective, x, method = 'gd', nIterations = 1000, alpha = 0.04,
+             tol = None, patience = 10):
+    ''' Runs nIterations of method from starting point x.
+
+        If tol is given, stops when the relative change of the objective has
+        been below tol for patience iterations in a row. Returns the final x
+        and the objective value before every iteration.
+    '''
+    stepMethods = {'gd': gd, 'momentum': momentum, 'nesterov': nesterov, 'adam': adam,
+                   'linesearch': linesearch, 'lbfgs': lbfgs}
+    if method not in stepMethods:
+        raise ValueError("Unknown optimizer '%s'" %method)
+    if nIterations < 1:
+        raise ValueError("nIterations must be at least 1, got %d" %nIterations)
+    ## float32 parameters stay float32
+    x = np.array(x, dtype=np.result_type(x, np.float32))
+    steps = stepMethods[method](countedObjective(objective), x, alpha)
+
+    values = np.zeros(nIterations)
+    nConverged = 0
+    for i in range(nIterations):
+        x, values[i] = next(steps)
+
+        ## Convergence check on relative change
+        if tol is not None and i > 0:
+            nConverged = nConverged+1 if abs(values[i-1]-values[i]) <= tol*values[i-1] else 0
+            if nConverged >= patience:
+                break
+
+    return x, values[:i+1]
+
+
+def countedObjective(objective):
+    ''' objective, counting evaluations (line searches use several per iteration) '''
+    def counted(x):
+        instrument.count('objectiveEvaluations')
+        return objective(x)
+    return counted
+
+
+## Every method is a generator yielding the new x and the objective value
+## before the step, once per iteration
+
+def gd(objective, x, alpha):
+    while True:
+        value, gradient = objective(x)
+        x = x - alpha*gradient
+        yield x, value
+
+
+def momentum(objective, x, alpha, beta = 0.9, nesterov = False):
+    velocity = np.zeros_like(x)
+    while True:
+        value, gradient = objective(x)
+        velocity = beta*velocity + gradient
+        ## Nesterov: gradient at the look-ahead point, in the form using the
+        ## gradient at x only
+        x = x - alpha*(gradient + beta*velocity if nesterov else velocity)
+        yield x, value
+
+
+def nesterov(objective, x, alpha, beta = 0.9):
+    return momentum(objective, x, alpha, beta, nesterov=True)
+
+
+def adam(objective, x, alpha, beta1 = 0.9, beta2 = 0.999, eps = 1e-8):
+    firstMoment = np.zeros_like(x)
+    secondMoment = np.zeros_like(x)
+    t = 0
+    while True:
+        t += 1
+        value, gradient = objective(x)
+        firstMoment = beta1*firstMoment + (1-beta1)*gradient
+        secondMoment = beta2*secondMoment + (1-beta2)*gradient**2
+        ## Bias corrected moments
+        stepSize = alpha*np.sqrt(1-beta2**t)/(1-beta1**t)
+        x = x - stepSize*firstMoment/(np.sqrt(secondMoment) + eps)
+        yield x, value
+
+
+def linesearch(objective, x, alpha):
+    value, gradient = objective(x)
+    step = alpha
+    while True:
+        ## Starting from twice the last accepted step lets the step grow again
+        newX, newValue, newGradient, step = backtrack(objective, x, value, gradient,
+                                                      -gradient, 2*step)
+        yield newX, value
+        x, value, gradient = newX, newValue, newGradient
+
+
+def lbfgs(objective, x, alpha, memory = 10):
+    value, gradient = objective(x)
+    sHistory, yHistory = [], []
+    while True:
+        direction = -lbfgsDirection(gradient, sHistory, yHistory)
+        ## First step has no curvature information and uses alpha
+        newX, newValue, newGradient, _ = backtrack(objective, x, value, gradient, direction,
+                                                   1.0 if sHistory else alpha)
+        yield newX, value
+
+        s, y = newX-x, newGradient-gradient
+        if np.dot(s, y) > 1e-10:
+            sHistory.append(s)
+            yHistory.append(y)
+            if len(sHistory) > memory:
+                sHistory.pop(0)
+                yHistory.pop(0)
+        x, value, gradient = newX, newValue, newGradient
+
+
+def lbfgsDirection(gradient, sHistory, yHistory):
+    ''' Inverse Hessian approximation times gradient, by the two-loop recursion '''
+    q = gradient.copy()
+    rhos = [1/np.dot(s, y) for s, y in zip(sHistory, yHistory)]
+    coefficients = []
+    for s, y, rho in reversed(list(zip(sHistory, yHistory, rhos))):
+        coefficient = rho*np.dot(s, q)
+        q -= coefficient*y
+        coefficients.append(coefficient)
+
+    if sHistory:
+        q *= np.dot(sHistory[-1], yHistory[-1])/np.dot(yHistory[-1], yHistory[-1])
+
+    for (s, y, rho), coefficient in zip(zip(sHistory, yHistory, rhos), reversed(coefficients)):
+        q += (coefficient - rho*np.dot(y, q))*s
+    return q
+
+
+def backtrack(objective, x, value, gradient, direction, step, shrink = 0.5,
+              c = 1e-4, maxSteps = 50):
+    ''' Backtracking line search along direction until the Armijo condition
+        holds. Returns new x, its objective value and gradient, and the step.
+    '''
+    slope = np.dot(gradient, direction)
+    if slope >= 0:
+        ## Not a descent direction, falling back to the gradient
+        direction, slope = -gradient, -np.dot(gradient, gradient)
+
+    for _ in range(maxSteps):
+        newX = x + step*direction
+        newValue, newGradient = objective(newX)
+        if newValue <= value + c*step*slope:
+            break
+        step *= shrink
+    return newX, newValue, newGradient, step
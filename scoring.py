@@ -0,0 +1,97 @@
+''' Gaussian scoring engine for the classification project in TTT4275 - EDC
+
+    A scoring model holds, for every class and mixture component, the mean,
+    the Cholesky factor of the precision matrix and the log normalization
+    constant (incl. log of the mixture weight). These are computed once, after
+    which log-likelihoods for all classes and components are evaluated for a
+    whole batch of samples at once. Only numpy is needed.
+
+    Shapes: C = classes, M = mixture components, D = features, N = samples.
+'''
+
+import numpy as np
+
+import instrument
+import precision
+
+
+def buildScoringModel(means, covariances, weights=None):
+    ''' Precomputes factorizations for Gaussian (mixture) class models.
+
+        means has shape (C, M, D). covariances has shape (C, M, D, D) for
+        full covariance matrices or (C, M, D) for diagonal ones. weights are
+        the mixture weights with shape (C, M), all ones if not given.
+        Factorizations are done in float64, the model is stored with the
+        configured precision.
+    '''
+    means = np.asarray(means, dtype=float)
+    covariances = np.asarray(covariances, dtype=float)
+    nClasses, nComponents, nFeatures = means.shape
+    if weights is None:
+        weights = np.ones((nClasses, nComponents))
+
+    if covariances.ndim == 3:
+        ## Diagonal covariance, precision Cholesky factor is diagonal as well
+        std = np.sqrt(covariances)
+        precChol = np.zeros((nClasses, nComponents, nFeatures, nFeatures))
+        precChol[..., np.arange(nFeatures), np.arange(nFeatures)] = 1/std
+        logDet = 2*np.sum(np.log(std), axis=-1)
+    else:
+        ## Sigma = L L^T  gives  (x-mu)^T Sigma^-1 (x-mu) = |L^-1 (x-mu)|^2
+        chol = np.linalg.cholesky(covariances)
+        identity = np.broadcast_to(np.eye(nFeatures), chol.shape)
+        precChol = np.linalg.solve(chol, identity)
+        logDet = 2*np.sum(np.log(np.diagonal(chol, axis1=-2, axis2=-1)), axis=-1)
+
+    logNorm = np.log(weights) - 0.5*(nFeatures*np.log(2*np.pi) + logDet)
+
+    return {'means': precision.asArray(means), 'precChol': precision.asArray(precChol),
+            'logNorm': precision.asArray(logNorm)}
+
+
+def mixtureParameters(model):
+    ''' Means, precision matrices (C, M, D, D) and mixture weights (C, M)
+        recovered from a scoring model
+    '''
+    means, precChol = model['means'], model['precChol']
+    nFeatures = means.shape[-1]
+    precisions = np.matmul(np.swapaxes(precChol, -1, -2), precChol)
+
+    ## logNorm = log(weight) - 0.5*(D*log(2*pi) + log|Sigma|)
+    logDetPrecChol = np.sum(np.log(np.diagonal(precChol, axis1=-2, axis2=-1)), axis=-1)
+    weights = np.exp(model['logNorm'] + 0.5*nFeatures*np.log(2*np.pi) - logDetPrecChol)
+    weights /= weights.sum(axis=-1, keepdims=True)
+
+    return means, precisions, weights
+
+
+def logLikelihoods(model, X, chunkSize=4096):
+    ''' Log-likelihood of every sample in X (N, D) under every class model,
+        summed over mixture components in log space. Returns shape (C, N).
+    '''
+    means, precChol, logNorm = model['means'], model['precChol'], model['logNorm']
+    X = np.asarray(X, dtype=means.dtype)
+
+    ## Whitened means, shape (C, M, D)
+    meansWhite = np.einsum('cmd,cmed->cme', means, precChol)
+    result = np.empty((len(means), len(X)), dtype=means.dtype)
+    instrument.count('pdfEvaluations', means.shape[0]*means.shape[1]*len(X))
+
+    for start in range(0, len(X), chunkSize):
+        XChunk = X[start:start+chunkSize]
+
+        ## Whitened samples minus whitened means, shape (C, M, n, D)
+        Y = np.matmul(XChunk, np.swapaxes(precChol, -1, -2)) - meansWhite[:, :, np.newaxis, :]
+        componentLL = logNorm[:, :, np.newaxis] - 0.5*np.einsum('cmnd,cmnd->cmn', Y, Y)
+
+        ## logsumexp over mixture components
+        maxLL = componentLL.max(axis=1)
+        result[:, start:start+chunkSize] = maxLL + np.log(
+            np.sum(np.exp(componentLL - maxLL[:, np.newaxis]), axis=1))
+
+    return result
+
+
+def predictClasses(model, X):
+    ''' Predicts class index of every sample in X from largest log-likelihood '''
+    return np.argmax(logLikelihoods(model, X), axis=0)
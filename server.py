@@ -0,0 +1,241 @@
+''' Local inference server for the trained classifiers of the classification
+    project in TTT4275 - EDC
+
+    Loads models saved with the models module once and serves predictions
+    over HTTP on the loopback interface (or a Unix socket). Concurrent
+    requests to the same model are collected into micro-batches, so they
+    are scored by one vectorized models.predict call.
+
+        POST /predict/<model>   {"samples": [[...], ...]} or {"sample": [...]}
+                                -> {"classes": [...], "labels": [...]}
+        GET  /metrics           request count, batch sizes, p50/p99 latency
+
+    Usage:
+        python server.py --model iris=iris.npz --model vowels=vowels.npz [--port 8275]
+        python server.py --model iris=iris.npz --bench   (loopback load test)
+'''
+
+import argparse
+import asyncio
+import collections
+import json
+import time
+
+import numpy as np
+
+import models
+
+maxBatchSize = 1024   ## Samples per scoring call
+maxBatchDelay = 0.002 ## Seconds to wait for more requests to join a batch
+
+
+class ModelWorker:
+    ''' Queue of pending requests for one model, scored in micro-batches '''
+
+    def __init__(self, model):
+        self.model = model
+        self.queue = asyncio.Queue()
+        self.batchSizes = collections.deque(maxlen=10000)
+
+    async def predict(self, samples):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((samples, future))
+        return await future
+
+    async def run(self):
+        while True:
+            batch = [await self.queue.get()]
+            nSamples = len(batch[0][0])
+            deadline = time.perf_counter() + maxBatchDelay
+
+            ## Collect more requests until the batch is full or the delay is over
+            while nSamples < maxBatchSize:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                nSamples += len(item[0])
+
+            self.score(batch)
+
+    def score(self, batch):
+        ''' Scores all samples of the batch at once and answers every request '''
+        try:
+            X = np.concatenate([samples for samples, _ in batch])
+            classes = models.predict(self.model, X)
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+
+        self.batchSizes.append(len(X))
+        start = 0
+        for samples, future in batch:
+            if not future.done():
+                future.set_result(classes[start:start+len(samples)])
+            start += len(samples)
+
+
+class InferenceServer:
+    ''' HTTP/1.1 server with keep-alive, answering predict and metrics requests '''
+
+    def __init__(self, modelLocs):
+        self.workers = {name: ModelWorker(models.loadModel(loc))
+                        for name, loc in modelLocs.items()}
+        self.latencies = collections.deque(maxlen=100000)
+        self.nRequests = 0
+        ## asyncio keeps only weak references to tasks
+        self.tasks = []
+
+    async def start(self, host='127.0.0.1', port=8275, unixPath=None):
+        for worker in self.workers.values():
+            self.tasks.append(asyncio.ensure_future(worker.run()))
+        if unixPath:
+            return await asyncio.start_unix_server(self.handleConnection, path=unixPath)
+        return await asyncio.start_server(self.handleConnection, host, port)
+
+    async def stop(self):
+        ''' Cancels the model workers '''
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def handleConnection(self, reader, writer):
+        try:
+            while True:
+                requestLine = await reader.readline()
+                if not requestLine:
+                    break
+                method, path, _ = requestLine.decode().split(' ', 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode().partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                status, response = await self.handleRequest(method, path, body)
+                payload = json.dumps(response).encode()
+                writer.write(b'HTTP/1.1 %d %s\r\nContent-Type: application/json\r\n'
+                             b'Content-Length: %d\r\n\r\n'
+                             %(status, b'OK' if status == 200 else b'Error', len(payload)) + payload)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def handleRequest(self, method, path, body):
+        if method == 'GET' and path == '/metrics':
+            return 200, self.metrics()
+
+        modelName = path[len('/predict/'):]
+        if method != 'POST' or not path.startswith('/predict/') or modelName not in self.workers:
+            return 404, {'error': 'Unknown path %s' %path}
+
+        startTime = time.perf_counter()
+        try:
+            request = json.loads(body)
+            samples = np.atleast_2d(np.asarray(request['samples'] if 'samples' in request
+                                               else request['sample'], dtype=float))
+            worker = self.workers[modelName]
+            if samples.shape[1] != len(worker.model['features']):
+                raise ValueError("Expected %d features per sample" %len(worker.model['features']))
+            classes = await worker.predict(samples)
+        except (KeyError, ValueError, TypeError) as error:
+            return 400, {'error': str(error)}
+
+        self.latencies.append(time.perf_counter()-startTime)
+        self.nRequests += 1
+        return 200, {'classes': classes.tolist(),
+                     'labels': worker.model['classLabels'][classes].tolist()}
+
+    def metrics(self):
+        ''' Request count, latency percentiles in ms and mean batch size '''
+        latencies = np.array(self.latencies)*1000
+        batchSizes = [size for worker in self.workers.values() for size in worker.batchSizes]
+        return {'requests': self.nRequests,
+                'p50LatencyMs': float(np.percentile(latencies, 50)) if len(latencies) else None,
+                'p99LatencyMs': float(np.percentile(latencies, 99)) if len(latencies) else None,
+                'meanBatchSize': float(np.mean(batchSizes)) if batchSizes else None}
+
+
+async def loadTest(host, port, modelName, sample, nRequests=10000, concurrency=64):
+    ''' Loopback load test: concurrency keep-alive clients sending nRequests
+        single-sample requests in total. Returns requests per second.
+    '''
+    body = json.dumps({'sample': list(sample)}).encode()
+    request = (b'POST /predict/%s HTTP/1.1\r\nHost: %s\r\nContent-Length: %d\r\n\r\n'
+               %(modelName.encode(), host.encode(), len(body)) + body)
+    remaining = [nRequests]
+
+    async def client():
+        reader, writer = await asyncio.open_connection(host, port)
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            writer.write(request)
+            await writer.drain()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line.lower().startswith(b'content-length'):
+                    length = int(line.split(b':')[1])
+                if line == b'\r\n':
+                    break
+            await reader.readexactly(length)
+        writer.close()
+
+    startTime = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    return nRequests/(time.perf_counter()-startTime)
+
+
+async def serve(args):
+    modelLocs = dict(model.split('=', 1) for model in args.model)
+    server = InferenceServer(modelLocs)
+    tcpServer = await server.start(args.host, args.port, args.unix)
+
+    if not args.bench:
+        print("Serving %s on %s" %(', '.join(modelLocs), args.unix or '%s:%d' %(args.host, args.port)))
+        try:
+            async with tcpServer:
+                await tcpServer.serve_forever()
+        finally:
+            await server.stop()
+        return
+
+    for name, worker in server.workers.items():
+        sample = np.zeros(len(worker.model['features']))
+        rate = await loadTest(args.host, args.port, name, sample, args.requests, args.concurrency)
+        print("%s: %.0f requests/s, %s" %(name, rate, server.metrics()))
+    tcpServer.close()
+    await tcpServer.wait_closed()
+    await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inference server for trained classifiers")
+    parser.add_argument('--model', action='append', required=True,
+                        help="name=path of model saved with the models module")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8275)
+    parser.add_argument('--unix', help="Unix socket path instead of TCP")
+    parser.add_argument('--bench', action='store_true', help="run loopback load test")
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    asyncio.run(serve(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+''' Hyperparameter sweep runner for the classification project in TTT4275 - EDC
+
+    Runs every combination in a grid of settings for the iris or the vowels
+    classifier across a process pool, and appends one JSON line per finished
+    run (error rates, confusion matrices, timings) to a results file. Runs
+    already in the results file are skipped, so an interrupted sweep is
+    resumed by starting it again with the same results file.
+
+    Grid file (JSON), lists are swept over:
+        {"task": "iris", "nTraining": [20, 30], "alpha": [0.01, 0.04],
+         "nIterations": [1000, 4000], "features": [[0, 1, 2, 3], [2, 3]],
+         "optimizer": ["gd", "lbfgs"], "precision": ["float64", "float32"]}
+        {"task": "vowels", "nTraining": [70], "M": [1, 2, 3],
+         "covType": ["full", "diag"], "features": [[7, 8, 9, 10, 11, 12, 13, 14, 15]]}
+    covType "tied" is only run for M > 1.
+
+    Usage: python sweep.py grid.json results.jsonl [--workers N] [--table results.csv]
+'''
+
+import argparse
+import contextlib
+import csv
+import io
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import figures
+import precision
+
+## Values used for settings missing from the grid
+irisDefaults = {'nTraining': 30, 'alpha': 0.04, 'nIterations': 4000,
+                'features': [0, 1, 2, 3], 'flip': False}
+vowelDefaults = {'nTraining': 70, 'M': 1, 'covType': 'full',
+                 'features': list(range(7, 16))}
+
+
+def expandGrid(grid):
+    ''' Expands grid dict into list of run configurations '''
+    task = grid['task']
+    defaults = irisDefaults if task == 'iris' else vowelDefaults
+    settings = dict(defaults)
+    settings.update({key: val for key, val in grid.items() if key != 'task'})
+
+    ## Features are a list per run, so a grid of features is a list of lists
+    names = sorted(settings)
+    values = [settings[name] if isinstance(settings[name], list) and
+              (name != 'features' or isinstance(settings[name][0], list))
+              else [settings[name]] for name in names]
+
+    configs = [dict(zip(names, combination), task=task)
+               for combination in itertools.product(*values)]
+
+    ## The single Gaussian classifier (M = 1) has full or diagonal covariance
+    ## only, so 'tied' is swept for mixtures only
+    return [config for config in configs
+            if not (task == 'vowels' and config['M'] == 1 and config['covType'] == 'tied')]
+
+
+def configKey(config):
+    ''' Unique string for a run configuration '''
+    return json.dumps(config, sort_keys=True)
+
+
+def runConfig(config):
+    ''' Trains and tests one configuration, returns result dict '''
+    figures.configure('off')
+    ## Runs without precision in the grid use PRECISION, as the scripts do
+    precision.configure(config.get('precision') or os.environ.get('PRECISION'))
+
+    ## The scripts report progress by printing, which is not wanted here
+    with contextlib.redirect_stdout(io.StringIO()):
+        if config['task'] == 'iris':
+            result = runIris(config)
+        else:
+            result = runVowels(config)
+
+    result['config'] = config
+    return result
+
+
+def runIris(config):
+    ''' Runs one configuration of the iris classifier '''
+    import iris
+
+    data = iris.normalize(iris.loadData())
+    removed = [i for i in range(iris.nFeatures) if i not in config['features']]
+    data = iris.removeFeatures(data, removed)
+    trainingData, testingData = iris.splitData(data, config['nTraining'], Flip=config['flip'])
+
+    startTime = time.perf_counter()
+    W, nIterationsUsed = iris.training(trainingData, config['nIterations'], config['alpha'],
+                                       optimizer=config.get('optimizer', 'gd'))
+    trainTime = time.perf_counter()-startTime
+
+    startTime = time.perf_counter()
+    trainMatrix = iris.confusionMatrixCalc(W, trainingData)
+    testMatrix = iris.confusionMatrixCalc(W, testingData)
+    testTime = time.perf_counter()-startTime
+
+    return makeResult(iris.findErrorRate, trainMatrix, testMatrix, trainTime, testTime)
+
+
+def runVowels(config):
+    ''' Runs one configuration of the vowel classifier, M = 1 is the single
+        Gaussian classifier
+    '''
+    import vowels
+
+    types, data = vowels.loadData(config['features'])
+    dataset = vowels.makeDataset(data, vowels.vowelLabels(types))
+    trainingData, testingData = vowels.splitData(dataset, config['nTraining'])
+
+    if config['M'] == 1 and config['covType'] not in ('full', 'diag'):
+        raise ValueError("Covariance type '%s' needs M > 1" %config['covType'])
+
+    startTime = time.perf_counter()
+    if config['M'] == 1:
+        models = vowels.singleGMTraining(trainingData, diag=config['covType'] == 'diag')
+        scoringModel = vowels.singleGMScoringModel(models)
+        testing = vowels.singleGMTesting
+    else:
+        models = vowels.GMMTraining(trainingData, config['M'], covType=config['covType'])
+        scoringModel = vowels.GMMScoringModel(models)
+        testing = lambda model, data: vowels.GMMTesting(model, data, config['M'])
+    trainTime = time.perf_counter()-startTime
+
+    startTime = time.perf_counter()
+    trainMatrix = vowels.confusionMatrixCalc(*testing(scoringModel, trainingData))
+    testMatrix = vowels.confusionMatrixCalc(*testing(scoringModel, testingData))
+    testTime = time.perf_counter()-startTime
+
+    return makeResult(vowels.findErrorRate, trainMatrix, testMatrix, trainTime, testTime)
+
+
+def makeResult(findErrorRate, trainMatrix, testMatrix, trainTime, testTime):
+    ''' Collects error rates, confusion matrices and timings of a run '''
+    return {'trainErrorRate': float(findErrorRate(trainMatrix)),
+            'testErrorRate': float(findErrorRate(testMatrix)),
+            'trainConfusionMatrix': np.asarray(trainMatrix).astype(int).tolist(),
+            'testConfusionMatrix': np.asarray(testMatrix).astype(int).tolist(),
+            'trainTime': trainTime, 'testTime': testTime}
+
+
+def loadResults(resultsLoc):
+    ''' Reads finished runs from results file, skipping a half written last line '''
+    results = []
+    if os.path.exists(resultsLoc):
+        with open(resultsLoc) as resultsFile:
+            for line in resultsFile:
+                try:
+                    results.append(json.loads(line))
+                except json.JSONDecodeError:
+                    pass
+    return results
+
+
+def runSweep(grid, resultsLoc, nWorkers=1):
+    ''' Runs all configurations in grid not already in resultsLoc, appending
+        results as they finish. Returns all results.
+    '''
+    results = loadResults(resultsLoc)
+    done = set(configKey(result['config']) for result in results)
+    configs = [config for config in expandGrid(grid) if configKey(config) not in done]
+    print("Sweep: %d runs, %d already done" %(len(configs)+len(done), len(done)))
+
+    with open(resultsLoc, 'a') as resultsFile, \
+            ProcessPoolExecutor(max_workers=nWorkers) as executor:
+        futures = [executor.submit(runConfig, config) for config in configs]
+        for future in as_completed(futures):
+            result = future.result()
+            resultsFile.write(json.dumps(result) + '\n')
+            resultsFile.flush()
+            results.append(result)
+            print("%s: test error rate %.1f %%" %(configKey(result['config']),
+                                                   result['testErrorRate']))
+
+    return results
+
+
+def run(gridLoc, resultsLoc, nWorkers=None, tableLoc=None):
+    ''' Runs the sweep in grid file gridLoc and writes the CSV table to
+        tableLoc if given. nWorkers = None uses all CPUs.
+    '''
+    with open(gridLoc) as gridFile:
+        grid = json.load(gridFile)
+
+    results = runSweep(grid, resultsLoc, nWorkers)
+    if tableLoc:
+        writeTable(results, tableLoc)
+    return results
+
+
+def writeTable(results, tableLoc):
+    ''' Writes settings, error rates and timings of all runs as CSV '''
+    names = sorted(set(name for result in results for name in result['config']))
+    columns = ['trainErrorRate', 'testErrorRate', 'trainTime', 'testTime']
+
+    with open(tableLoc, 'w', newline='') as tableFile:
+        writer = csv.writer(tableFile)
+        writer.writerow(names + columns)
+        for result in sorted(results, key=lambda result: result['testErrorRate']):
+            writer.writerow([result['config'].get(name, '') for name in names] +
+                            [result[column] for column in columns])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hyperparameter sweep runner")
+    parser.add_argument('grid', help="JSON file with grid of settings")
+    parser.add_argument('results', help="JSON lines results file, appended to")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--table', help="CSV file for table sorted by test error rate")
+    args = parser.parse_args()
+
+    run(args.grid, args.results, args.workers, args.table)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,14 +4,43 @@
 
 import numpy as np
 import os
-from sklearn.mixture import GaussianMixture as GMM
-import pandas as pd
-from scipy.stats import multivariate_normal
-import matplotlib.pyplot as plt
-import seaborn as sn
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from collections import namedtuple
+
+import datacache
+import evaluation
+import figures
+import instrument
+import mixture
+import precision
+import scoring
+
+## scipy and matplotlib are imported where they are used, so
+## the stages that do not need them start fast
+
+__location__ = os.path.realpath(
+    os.path.join(os.getcwd(), os.path.dirname(__file__)))
+
+vowelDataLoc = os.path.join(__location__, 'Data/Wovels/vowdata_nohead.dat')
 
 vowels = ['ae','ah','aw','eh','er','ei','ih','iy','oa','oo','uh','uw']
 
+## Names of the numeric columns 1-15 of the data file (see readme.txt)
+featureNames = ['duration', 'F0', 'F1', 'F2', 'F3', 'F4',
+                'F1 20%', 'F2 20%', 'F3 20%', 'F1 50%', 'F2 50%', 'F3 50%',
+                'F1 80%', 'F2 80%', 'F3 80%']
+
+## Arrays of the sufficient statistics, see classStatistics
+statisticsKeys = ('count', 'sum', 'outer')
+
+VowelData = namedtuple('VowelData', ['features', 'labels', 'offsets'])
+VowelData.__doc__ = ''' Array-backed vowel dataset with rows sorted by vowel.
+        - features = contiguous feature matrix, one row per sample
+        - labels = vowel index (into vowels) of every row
+        - offsets = rows offsets[i]:offsets[i+1] belong to vowel i
+    '''
+
 def main():
     global features
     nTraining = 70
@@ -19,10 +48,8 @@ def main():
 
     types, data = loadData(features)
 
-    vowelCol = pd.Series([col1[3:] for col1 in types])
-
-    df = pd.DataFrame(data, index=vowelCol)
-    trainingData, testingData = splitData(df, nTraining)
+    dataset = makeDataset(data, vowelLabels(types))
+    trainingData, testingData = splitData(dataset, nTraining)
 
     ### Task 1 a-c ###
     print("Starting task 1:")
@@ -62,19 +89,34 @@ def main():
     confMatrix = confusionMatrixCalc(predictions, actualVowels)
     plotConfusionMatrix(confMatrix)
 
+    ## Automatic alternative to choosing the features by hand
+    print("Searching subsets of up to 4 of all feature columns...")
+    allFeatures = range(1, 16)
+    types, allData = loadData(allFeatures)
+    allTrainingData, allTestingData = splitData(makeDataset(allData, vowelLabels(types)), nTraining)
+    ranking = featureSubsetSearch(allTrainingData, allTestingData, allFeatures, maxSize=4)
+    printSubsetRanking(ranking[:20])
+
+    with instrument.stage('render'):
+        figures.flush()
+    instrument.report('vowels')
+
 def findErrorRate(X):
     ''' Calculates error rate from confusion matrix '''
     errorRate = (1-np.sum(X.diagonal())/np.sum(X))*100
     return errorRate
 
-def getMeanAndCovariance(df, features, vowel, diag=False):
+def getMeanAndCovariance(dataset, features, vowel, diag=False):
     '''
         Calculates mean and covariance of given vowel and
-        features to use.
+        features to use (feature columns of dataset, None for all).
     '''
-    vowelDataFrame = df.loc[vowel]
-    mean = vowelDataFrame.mean(axis=0).values
-    cov = vowelDataFrame.cov().values
+    vowelData = classData(dataset, vowels.index(vowel))
+    if features is not None:
+        vowelData = vowelData[:, features]
+
+    mean = vowelData.mean(axis=0)
+    cov = np.cov(vowelData, rowvar=False)
 
     if diag:
        cov = np.diag(np.diag(cov))
@@ -83,19 +125,25 @@ def getMeanAndCovariance(df, features, vowel, diag=False):
 
 def confusionMatrixCalc(predictions, actualVowels, diag=False):
     ''' Builds confusion matrix based on classifier predictions and actual class.
+        Actual vowel (name or index) along rows, predicted vowel along columns.
     '''
-    confMatrix = np.zeros((len(vowels), len(vowels)))
-
-    for i in range(len(predictions)):
-        vowelIndex = vowels.index(actualVowels[i])
-        confMatrix[vowelIndex][(predictions[i])] += 1
+    vowelIndex = np.asarray(actualVowels)
+    if vowelIndex.dtype.kind not in 'iu':
+        vowelIndex = evaluation.labelIndices(vowelIndex, vowels)
+    confMatrix = evaluation.confusionMatrix(vowelIndex, predictions, len(vowels))
 
-    return confMatrix
+    return confMatrix.astype(float)
 
 def plotConfusionMatrix(confusionMatrix):
     ''' Function which plots confusion matrix as heat map with
         calculated error rate.
     '''
+    errorRate = findErrorRate(confusionMatrix)
+    print("errorRate = ", errorRate)
+    if not figures.enabled():
+        return
+    import matplotlib.pyplot as plt
+
     ## Plotting
     fig, ax = plt.subplots(figsize=(8,6))
     im = ax.imshow(confusionMatrix, cmap='copper')
@@ -107,8 +155,6 @@ def plotConfusionMatrix(confusionMatrix):
              rotation_mode="anchor")
 
     ### Plotting error rate within heat map ###
-    errorRate = findErrorRate(confusionMatrix)
-    print("errorRate = ", errorRate)
     textstr = ('Error rate = %.1f%%' %(errorRate))
     textBox = dict(boxstyle='round', facecolor='white', alpha=0.8)
     ax.text(0.72, 0.935, textstr, transform=ax.transAxes, fontsize=10,
@@ -123,100 +169,289 @@ def plotConfusionMatrix(confusionMatrix):
     ax.set_title("Heatmap visualizing confusion matrix")
     fig.tight_layout()
     plt.colorbar(im)
-    plt.show()
+    figures.output(fig, 'confusion_matrix')
 
 
+@instrument.timed('testing')
 def GMMTesting(GaussianMixtureModels, testingData, M):
     ''' Tests the GMM classifier by using mixture models to find  the
-        largest probabilities from input testing samples and predicting class.
+        largest log-likelihoods from input testing samples and predicting class.
+        Takes the trained mixture parameters or a scoring model already
+        built from them by GMMScoringModel.
     '''
-    probabilities = np.zeros((len(vowels), len(testingData)))
-
-    for i, vowel in enumerate(vowels):
-        GaussianMixtureModel = GaussianMixtureModels[i] ## Get model for current vowel
-        for j in range(M):
-            curve = multivariate_normal(mean=GaussianMixtureModel.means_[j],
-                                        cov=GaussianMixtureModel.covariances_[j], allow_singular=True)
-            probabilities[i] += GaussianMixtureModel.weights_[j] * curve.pdf(testingData.values)
+    if 'precChol' in GaussianMixtureModels:
+        scoringModel = GaussianMixtureModels
+    else:
+        scoringModel = GMMScoringModel(GaussianMixtureModels)
 
-    predictions = np.argmax(probabilities, axis=0)
-    actualVowels = testingData.index.values
+    predictions = scoring.predictClasses(scoringModel, testingData.features)
+    actualVowels = testingData.labels
 
     return predictions, actualVowels
 
-def GMMTraining(trainingData, M):
+def GMMScoringModel(GaussianMixtureModels):
+    ''' Scoring model (see scoring.buildScoringModel) from the fitted
+        per-vowel mixture parameters
+    '''
+    return mixture.scoringModel(GaussianMixtureModels)
+
+@instrument.timed('training')
+def GMMTraining(trainingData, M, seed=0, covType='diag', initModel=None):
     ''' Trains the GMM classifier by bulding mixure models from training vowel
-        samples, using GMM method.
+        samples, using EM. The mixtures of all vowels are fitted together in
+        one batched computation (see mixture.fitMixtures). covType is 'diag',
+        'full' or 'tied'.
+
+        initModel is an earlier scoring model (GMMScoringModel or a saved
+        vowel model) with M components, used to warm start EM when retraining
+        after new recordings are added.
     '''
+    trainingVowelData = [classData(trainingData, i) for i in range(len(vowels))]
+    init = None if initModel is None else scoring.mixtureParameters(initModel)
 
-    GaussianMixtureModels = []
-    for vowel in vowels:
-        trainingVowelData = trainingData.loc[vowel].values
-        gmm = GMM(n_components=M, covariance_type='diag',reg_covar=1e-4, random_state=0)
-        gmm.fit(trainingVowelData)
-        GaussianMixtureModels.append(gmm)
+    GaussianMixtureModels = mixture.fitMixtures(trainingVowelData, M, covType,
+                                                seed=seed, init=init)
 
     return GaussianMixtureModels
 
-def singleGMTraining(trainingData, diag=False):
+@instrument.timed('training')
+def singleGMTraining(trainingData, diag=False, nWorkers=1):
     ''' Trains the single Gaussian mode classifier by building multivariate models
-        from the input training vowel data
+        from the input training vowel data. Vowels are handled in a thread pool
+        if nWorkers > 1 (numpy releases the GIL in the covariance computation).
     '''
-    vowelModels = list()
+    from scipy.stats import multivariate_normal
 
-    for vowel in vowels:
-        mean, covariance = getMeanAndCovariance(trainingData, features, vowel, diag)
-        multiVariateModel = multivariate_normal(mean = mean, cov=covariance)
-        vowelModels.append(multiVariateModel)
+    def fitVowel(vowel):
+        mean, covariance = getMeanAndCovariance(trainingData, None, vowel, diag)
+        return multivariate_normal(mean = mean, cov=covariance)
+
+    if nWorkers <= 1:
+        return [fitVowel(vowel) for vowel in vowels]
+
+    with ThreadPoolExecutor(max_workers=nWorkers) as executor:
+        vowelModels = list(executor.map(fitVowel, vowels))
 
     return vowelModels
 
+def classStatistics(dataset):
+    ''' Sufficient statistics of every vowel: number of samples, sum of
+        samples and sum of outer products of samples. Statistics of new
+        recordings are added with updateStatistics.
+    '''
+    count = np.diff(dataset.offsets)
+    features = np.asarray(dataset.features, dtype=float) ## int16 products would overflow
+    ## Vowels without samples give empty arrays, so zero sums
+    vowelData = np.split(features, dataset.offsets[1:-1])
+    sums = np.array([data.sum(axis=0) for data in vowelData])
+    outer = np.array([np.matmul(data.T, data) for data in vowelData])
+    return {'count': count, 'sum': sums, 'outer': outer}
+
+def updateStatistics(stats, newData, features=None):
+    ''' Adds samples in dataset newData to statistics, O(new samples). stats
+        can be statistics loaded with models.loadModel, then features (column
+        numbers of newData as given to loadData) must match the saved ones.
+        Returns count, sum and outer only.
+    '''
+    if features is not None and 'features' in stats:
+        features, savedFeatures = [int(val) for val in features], stats['features'].tolist()
+        if features != savedFeatures:
+            raise ValueError("Features %s of new data differ from saved features %s"
+                             %(features, savedFeatures))
+    if newData.features.shape[1] != stats['sum'].shape[1]:
+        raise ValueError("New data has %d features, statistics have %d"
+                         %(newData.features.shape[1], stats['sum'].shape[1]))
+
+    newStats = classStatistics(newData)
+    return {key: stats[key] + newStats[key] for key in statisticsKeys}
+
+def meanAndCovarianceFromStatistics(stats, vowel, diag=False):
+    ''' Same mean and covariance as getMeanAndCovariance, from statistics '''
+    i = vowels.index(vowel)
+    n = stats['count'][i]
+    mean = stats['sum'][i]/n
+    cov = (stats['outer'][i] - n*np.outer(mean, mean))/(n-1)
+
+    if diag:
+       cov = np.diag(np.diag(cov))
+
+    return mean, cov
+
+def singleGMScoringModelFromStatistics(stats, diag=False):
+    ''' Single Gaussian scoring model from statistics, no pass over the data '''
+    means, covariances = zip(*[meanAndCovarianceFromStatistics(stats, vowel, diag)
+                               for vowel in vowels])
+    return scoring.buildScoringModel(np.array(means)[:, np.newaxis],
+                                     np.array(covariances)[:, np.newaxis])
+
+@instrument.timed('testing')
 def singleGMTesting(vowelModels, testingData):
     ''' Tests the single Gaussian classifier by using the multivariate vowel models
         against testing samples, where class prediction is decided from largest
-        probability value
+        log-likelihood value. Takes the list of trained models or a scoring
+        model already built from them by singleGMScoringModel.
     '''
-    probabilities = np.zeros((len(vowels), len(testingData)))
+    if isinstance(vowelModels, dict):
+        scoringModel = vowelModels
+    else:
+        scoringModel = singleGMScoringModel(vowelModels)
 
-    for i, vowel in enumerate(vowels):
-        i_vowel = vowelModels[i]
-        probabilities[i] = i_vowel.pdf(testingData.values)
-
-    predictions = np.argmax(probabilities, axis=0)
-    actualVowels = testingData.index.values
+    predictions = scoring.predictClasses(scoringModel, testingData.features)
+    actualVowels = testingData.labels
 
     return predictions, actualVowels
 
-def splitData(df, nTraining):
-    ''' Splits data in to training and testing sub-sets
+def singleGMScoringModel(vowelModels):
+    ''' Stacks the trained single Gaussian vowel models into a scoring model
+        with one mixture component per vowel (see scoring.buildScoringModel)
     '''
+    return scoring.buildScoringModel(
+        [[model.mean] for model in vowelModels],
+        [[model.cov] for model in vowelModels])
+
+def crossValidationFitPredict(data, labels, trainIndex, testIndex, M=1, diag=False):
+    ''' Classifier for crossvalidation.crossValidate. data is the feature array
+        from loadData and labels the vowel index of its rows (vowelLabels).
+        M = 1 gives the single Gaussian classifier.
+    '''
+    trainingData = makeDataset(data[trainIndex], labels[trainIndex])
+
+    if M == 1:
+        scoringModel = singleGMScoringModel(singleGMTraining(trainingData, diag))
+    else:
+        covType = 'diag' if diag else 'full'
+        scoringModel = GMMScoringModel(GMMTraining(trainingData, M, covType=covType))
+
+    return scoring.predictClasses(scoringModel, data[testIndex])
+
+@instrument.timed('featureSubsetSearch')
+def featureSubsetSearch(trainingData, testingData, features, diag=False, method='exhaustive',
+                        maxSize=None, cache=None, modelCache=None):
+    ''' Tests the single Gaussian classifier on feature subsets and returns a
+        list of (subset, testing error rate, training error rate) sorted by
+        testing error rate. features are the column numbers of the dataset
+        columns as given to loadData, and subsets are tuples of them.
+
+        Mean and covariance of every vowel are fitted once with all features.
+        The model of a subset is the marginal Gaussian, i.e. the rows and
+        columns of the subset in mean and covariance, so nothing is refitted
+        or reloaded.
+
+        method:
+            - 'exhaustive' = all subsets with up to maxSize features
+            - 'forward' = greedy, adding the best feature one at a time
+            - 'backward' = greedy, removing the least useful feature one at a time
+
+        Error rates are stored in the dict cache and the scoring models, with
+        their Cholesky factors and log determinants, in the dict modelCache.
+        Both are keyed by diag and the data as well as the subset, so dicts
+        passed to several searches are reused between them where the
+        settings match. The search itself is evaluation.subsetSearch.
+    '''
+    if cache is None:
+        cache = {}
+    if modelCache is None:
+        modelCache = {}
+    features = tuple(features)
+    trainingKey = evaluation.dataKey(trainingData.features, trainingData.labels)
+    modelSettings = (diag, trainingKey)
+    settings = modelSettings + (evaluation.dataKey(testingData.features, testingData.labels),)
+
+    ## One fit with all features
+    means, covariances = zip(*[getMeanAndCovariance(trainingData, None, vowel, diag)
+                               for vowel in vowels])
+    means, covariances = np.array(means), np.array(covariances)
+
+    def evaluate(subsets):
+        errorRates = []
+        for subset in subsets:
+            columns = [features.index(feature) for feature in subset]
+            modelKey = (modelSettings, subset)
+            if modelKey not in modelCache:
+                modelCache[modelKey] = marginalScoringModel(means, covariances, columns)
+            errorRates.append(tuple(
+                100*np.mean(scoring.predictClasses(modelCache[modelKey], data.features[:, columns])
+                            != data.labels)
+                for data in (testingData, trainingData)))
+        return errorRates
+
+    return evaluation.subsetSearch(features, evaluate, cache, method, maxSize, settings)
+
+def marginalScoringModel(means, covariances, columns):
+    ''' Single Gaussian scoring model of the given columns only, from means
+        (vowels, features) and covariances (vowels, features, features)
+        fitted with all features
+    '''
+    return scoring.buildScoringModel(means[:, np.newaxis, columns],
+                                     covariances[:, np.newaxis][..., columns, :][..., columns])
+
+def printSubsetRanking(ranking):
+    ''' Prints result of featureSubsetSearch as table '''
+    print("%-55s %10s %10s" %("Features", "Test [%]", "Train [%]"))
+    for subset, testErrorRate, trainErrorRate in ranking:
+        names = ', '.join(featureNames[feature-1] for feature in subset)
+        print("%-55s %10.1f %10.1f" %(names, testErrorRate, trainErrorRate))
+
+def makeDataset(features, labels):
+    ''' Builds VowelData from feature rows and their vowel indices, with
+        features converted to the configured precision
+    '''
+    labels = np.asarray(labels)
+    order = np.argsort(labels, kind='stable') ## Keeps file order within a vowel
+    counts = np.bincount(labels, minlength=len(vowels))
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    features = np.ascontiguousarray(features[order], dtype=precision.dtype)
+    return VowelData(features, labels[order], offsets)
+
+def classData(dataset, vowelIndex):
+    ''' Feature rows of one vowel, as a view '''
+    return dataset.features[dataset.offsets[vowelIndex]:dataset.offsets[vowelIndex+1]]
+
+def vowelLabels(types):
+    ''' Vowel index of every file name like 'm01ae' '''
+    return evaluation.labelIndices([name[3:] for name in types], vowels)
+
+@instrument.timed('splitData')
+def splitData(dataset, nTraining):
+    ''' Splits data in to training and testing sub-sets, using the first
+        nTraining samples of every vowel for training
+    '''
+    offsets = dataset.offsets
+    trainingRows = np.concatenate([np.arange(offsets[i], min(offsets[i]+nTraining, offsets[i+1]))
+                                   for i in range(len(vowels))])
+    testingMask = np.ones(len(dataset.labels), dtype=bool)
+    testingMask[trainingRows] = False
 
-    trainingdf = pd.DataFrame()
-    testingdf = pd.DataFrame()
-
-    trainingdf = pd.concat([trainingdf.append(df.loc[vowel][:nTraining]) for vowel in vowels])
-    testingdf = pd.concat([testingdf.append(df.loc[vowel][nTraining:]) for vowel in vowels])
+    trainingData = makeDataset(dataset.features[trainingRows], dataset.labels[trainingRows])
+    testingData = makeDataset(dataset.features[testingMask], dataset.labels[testingMask])
 
-    return trainingdf, testingdf
+    return trainingData, testingData
 
 
-def loadData(features):
-    ''' Loads raw feature data from vowels data file
+@instrument.timed('loadData')
+def loadData(features, dataLoc=vowelDataLoc):
+    ''' Loads raw feature data from vowels data file. The parsed file is
+        cached, see parseData. Features are column numbers in the file
+        (0 is the file name).
     '''
+    arrays = datacache.cachedArrays(dataLoc, parseData)
 
-    rawData = np.genfromtxt('./Data/Wovels/vowdata_nohead.dat', dtype = str, delimiter=',',)
-    types = list()
-    data = np.zeros((len(rawData), len(features)), dtype='int')
+    types = np.asarray(arrays['types'])
+    data = arrays['data'][:, [val-1 for val in features]]
+    return types, data
 
-    for i, line in enumerate(rawData):
-        line = line.split()
-        types.append(line[0])
-        for index, val in enumerate(features):
-            data[i, index] = int(line[val])
 
-    types = np.array(types)
-    return types, data
+def parseData(dataLoc):
+    ''' Parses vowels data file into file names and an int16 array with
+        all numeric columns
+    '''
+    types = np.loadtxt(dataLoc, dtype=str, usecols=0)
+    data = np.loadtxt(dataLoc, dtype=np.int16, usecols=range(1, 16))
+    return {'types': types, 'data': data}
 
 
 if __name__ == '__main__':
+    instrument.configureFromArgs(sys.argv[1:])
+    precision.configureFromArgs(sys.argv[1:])
     main()